@@ -1,9 +1,12 @@
-from flask import Flask, request, jsonify
-from sentence_transformers import SentenceTransformer
+from flask import Flask, Response, g, request, jsonify
 from pinecone import Pinecone
 from google.cloud import dialogflow_v2 as dialogflow
-from t1 import search
+from t1 import embeddings, search
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, REQUEST_SECONDS, collector, render as render_metrics, upstream
+from log import setup_logging
+import logging
 import os
+import time
 import uuid
 from dotenv import load_dotenv
 import google.generativeai as genai
@@ -14,6 +17,7 @@ from flask_cors import CORS
 app = Flask(__name__)
 CORS(app)
 load_dotenv()
+setup_logging()
 
 # --- ENVIRONMENT VARIABLE LOADING ---
 Service_Type = os.getenv("Service_Type")
@@ -53,8 +57,6 @@ pc = Pinecone(api_key=Pinecone_API_KEY)
 INDEX_NAME = "intent-index"
 index = pc.Index(INDEX_NAME)
 
-model = SentenceTransformer('BAAI/bge-small-en')
-
 INTENT_TO_REFINED_QUERY = {
     "GetLatestAnnouncement": "new events",
     "Complaint": "I have an issue",
@@ -76,31 +78,35 @@ Identify and extract Faculty Name and Date.
 Return a JSON object with "faculty_name" and "date" (YYYY-MM-DD).
 """
     try:
-        response = gemini_model.generate_content(prompt)
+        with upstream('gemini'):
+            response = gemini_model.generate_content(prompt)
         json_string = response.text.strip().strip("`").replace("\n", "")
         if json_string.startswith("json"):
             json_string = json_string[4:]
         return json.loads(json_string)
     except Exception as e:
-        print(f"Error extracting slot parameters with Gemini: {e}")
+        logging.error(f"Error extracting slot parameters with Gemini: {e}")
         return None
 
 def get_book_title_from_gemini(query):
     gemini_model = genai.GenerativeModel('gemini-2.0-flash')
     prompt = f"Extract the book title from the following sentence and fix spelling: {query}"
     try:
-        response = gemini_model.generate_content(prompt)
+        with upstream('gemini'):
+            response = gemini_model.generate_content(prompt)
         return response.text
     except Exception as e:
-        print(f"Error while generating content: {e}")
+        logging.error(f"Error while generating content: {e}")
 
 def classify_intent(query, threshold=0.75):
-    query_embedding = model.encode(query).tolist()
-    search_result = index.query(
-        vector=query_embedding,
-        top_k=1,
-        include_metadata=True
-    )
+    # Cached by normalized text; repeated phrasings skip the model entirely
+    query_embedding = embeddings.embed(query).tolist()
+    with upstream('pinecone'):
+        search_result = index.query(
+            vector=query_embedding,
+            top_k=1,
+            include_metadata=True
+        )
     matches = search_result.get("matches", [])
     if matches and matches[0]["score"] >= threshold:
         return matches[0]["metadata"]["intent"]
@@ -113,12 +119,44 @@ def detect_intent_texts(project_id, session_id, text, language_code, contexts=No
     text_input = dialogflow.TextInput(text=text, language_code=language_code)
     query_input = dialogflow.QueryInput(text=text_input)
 
-    return session_client.detect_intent(
-        request={"session": session, "query_input": query_input}
-    )
+    with upstream('dialogflow'):
+        return session_client.detect_intent(
+            request={"session": session, "query_input": query_input}
+        )
 
 session_contexts = {}
 
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request(response):
+    start = getattr(g, 'request_start', None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        elapsed = time.perf_counter() - start
+        REQUEST_SECONDS.labels(route, response.status_code).observe(elapsed)
+        # Sampled per route through LOG_SAMPLE_RATES
+        logging.info(f"{request.method} {route} {response.status_code}", extra={
+            'route': route, 'session': (request.get_json(silent=True) or {}).get('session_id'),
+            'ms': round(elapsed * 1000, 1),
+        })
+    return response
+
+
+@collector
+def session_metrics():
+    return [('middleware_sessions', 'gauge', 'Sessions with stored Dialogflow contexts', [({}, len(session_contexts))])]
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return Response(render_metrics(), content_type=METRICS_CONTENT_TYPE)
+
+
 @app.route("/query", methods=["POST"])
 def query_bot():
     data = request.get_json()
@@ -0,0 +1,94 @@
+"""
+LRU cache of query embeddings, so repeated phrasings ("new events", "exit info")
+skip the transformer forward pass. Bounded by the memory the vectors take.
+"""
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict
+
+from metrics import collector, counter, upstream
+
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+
+_WHITESPACE = re.compile(r'\s+')
+
+CACHE_REQUESTS = counter('middleware_embedding_cache_requests', 'Embedding lookups by result', ('result',))
+
+
+def normalize_query(query):
+    """Cache key: casefolded, whitespace collapsed. The key is also what gets embedded."""
+    return _WHITESPACE.sub(' ', query).strip().casefold()
+
+
+class EmbeddingCache:
+    def __init__(self, encode, max_bytes=EMBEDDING_CACHE_MAX_BYTES):
+        self._encode = encode
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.evictions = 0
+        self._hits = CACHE_REQUESTS.labels('hit')
+        self._misses = CACHE_REQUESTS.labels('miss')
+
+    @staticmethod
+    def _size(key, vector):
+        return vector.nbytes + sys.getsizeof(key)
+
+    def embed(self, query):
+        """Embedding of `query` as a read-only numpy vector, from the cache when possible"""
+        key = normalize_query(query)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+        if vector is not None:
+            self._hits.inc()
+            return vector
+
+        self._misses.inc()
+        # Encoded outside the lock; two requests missing on the same key both encode, which is harmless
+        with upstream('embedding'):
+            vector = self._encode(key)
+        vector.flags.writeable = False
+        size = self._size(key, vector)
+        if size > self.max_bytes:
+            return vector
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= self._size(key, previous)
+            self._entries[key] = vector
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                old_key, old_vector = self._entries.popitem(last=False)
+                self.bytes -= self._size(old_key, old_vector)
+                self.evictions += 1
+        return vector
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_caches = []
+
+
+def embedding_cache(encode, max_bytes=EMBEDDING_CACHE_MAX_BYTES):
+    cache = EmbeddingCache(encode, max_bytes)
+    _caches.append(cache)
+    return cache
+
+
+@collector
+def embedding_cache_metrics():
+    return [
+        ('middleware_embedding_cache_entries', 'gauge', 'Query embeddings held in memory',
+         [({}, sum(len(cache) for cache in _caches))]),
+        ('middleware_embedding_cache_bytes', 'gauge', 'Memory taken by cached query embeddings',
+         [({}, sum(cache.bytes for cache in _caches))]),
+        ('middleware_embedding_cache_evictions', 'counter', 'Embeddings evicted to stay under the memory bound',
+         [({}, sum(cache.evictions for cache in _caches))]),
+    ]
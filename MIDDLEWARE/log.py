@@ -0,0 +1,153 @@
+"""
+Structured logging for the middleware (same setup as ML/utils/log.py, kept
+separate because the two services are deployed independently).
+"""
+import atexit
+import copy
+import datetime
+import hashlib
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # or "text" for local runs
+LOG_MAX_FIELD = int(os.getenv("LOG_MAX_FIELD", "512"))
+# e.g. "/query=0.1"; routes not listed use LOG_SAMPLE_DEFAULT
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")
+LOG_SAMPLE_DEFAULT = float(os.getenv("LOG_SAMPLE_DEFAULT", "1"))
+
+# LNMIIT roll numbers such as 22UCS207 or 21DEC104
+# (also inside session ids like session_22UCS207, where \b wouldn't match)
+ROLL_NUMBER = re.compile(r'(?<![A-Za-z0-9])\d{2}[A-Za-z]{3}\d{3}(?![0-9])')
+
+_STANDARD_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+
+def _roll_token(match):
+    # Stable per roll number, so one student's requests can still be followed
+    return 'roll#' + hashlib.sha1(match.group(0).upper().encode()).hexdigest()[:8]
+
+
+def redact(text):
+    return ROLL_NUMBER.sub(_roll_token, text)
+
+
+def truncate(text, limit=LOG_MAX_FIELD):
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}... [{len(text) - limit} more chars]"
+
+
+def _clean(value, limit=LOG_MAX_FIELD):
+    if isinstance(value, str):
+        return redact(truncate(value, limit))
+    if isinstance(value, (int, float, bool)) or value is None:
+        return value
+    return redact(truncate(json.dumps(value, default=str), limit))
+
+
+def parse_sample_rates(spec):
+    rates = {}
+    for item in spec.split(','):
+        route, _, rate = item.partition('=')
+        if route.strip() and rate.strip():
+            rates[route.strip()] = float(rate)
+    return rates
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; extra= fields are included, all values truncated and redacted"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': _clean(record.getMessage()),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD_ATTRS and not key.startswith('_'):
+                entry[key] = _clean(value)
+        if record.exc_text:
+            entry['exc'] = _clean(record.exc_text, LOG_MAX_FIELD * 8)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class RedactingFormatter(logging.Formatter):
+    """Plain-text format with the same truncation and redaction as JSON"""
+
+    def format(self, record):
+        text = super().format(record)
+        return redact(truncate(text, LOG_MAX_FIELD * 8 if record.exc_text else LOG_MAX_FIELD))
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep only a fraction of the records tagged with extra={'route': ...}.
+    Warnings and errors are always kept, and so is anything without a route.
+    """
+
+    def __init__(self, rates, default=1.0):
+        super().__init__()
+        self.rates = rates
+        self.default = default
+
+    def filter(self, record):
+        route = getattr(record, 'route', None)
+        if route is None or record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(route, self.default)
+        return rate >= 1 or random.random() < rate
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # Merge args and render the traceback now (they may not survive the
+        # trip to the listener thread); formatting itself happens over there
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_listener = None
+
+
+def setup_logging():
+    """
+    Route all logging through a queue to a background thread that formats
+    and writes to stdout, so request threads never block on the stream.
+    Safe to call more than once.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    stream = logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT == 'text':
+        stream.setFormatter(RedactingFormatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    else:
+        stream.setFormatter(JsonFormatter())
+
+    log_queue = queue.SimpleQueue()
+    handler = _QueueHandler(log_queue)
+    handler.addFilter(SamplingFilter(parse_sample_rates(LOG_SAMPLE_RATES), LOG_SAMPLE_DEFAULT))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream)
+    _listener.start()
+    atexit.register(_listener.stop)
@@ -0,0 +1,230 @@
+"""
+Prometheus text-format metrics for the middleware (same design as ML/utils/metrics.py,
+kept separate because the two services are deployed independently).
+"""
+import bisect
+import logging
+import time
+
+# Seconds; covers everything from an embedding lookup to a Gemini answer
+DEFAULT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _CounterChild:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class _HistogramChild:
+    __slots__ = ('upper_bounds', 'counts', 'sum')
+
+    def __init__(self, upper_bounds):
+        self.upper_bounds = upper_bounds
+        self.counts = [0] * (len(upper_bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.upper_bounds, value)] += 1
+        self.sum += value
+
+    def time(self):
+        return _Timer(self)
+
+
+class _Timer:
+    __slots__ = ('child', 'start')
+
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.child.observe(time.perf_counter() - self.start)
+        return False
+
+
+class _Metric:
+    """
+    A labelled family. Callers resolve labels() once and keep the child, so the
+    hot path is a bare increment: no lock and no allocation. Increments rely on
+    the GIL (and on gevent's cooperative switching); a rare lost update under
+    heavy thread contention is acceptable for monitoring.
+    """
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            # setdefault is atomic, so racing creators end up with the same child
+            child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def samples(self):
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def samples(self):
+        for key, child in list(self._children.items()):
+            yield self.name + '_total', tuple(zip(self.labelnames, key)), child.value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.upper_bounds = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.upper_bounds)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def samples(self):
+        for key, child in list(self._children.items()):
+            labels = tuple(zip(self.labelnames, key))
+            counts = list(child.counts)
+            cumulative = 0
+            for bound, count in zip(self.upper_bounds + (float('inf'),), counts):
+                cumulative += count
+                yield self.name + '_bucket', labels + (('le', _format_value(float(bound))),), cumulative
+            yield self.name + '_count', labels, cumulative
+            yield self.name + '_sum', labels, child.sum
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric '{metric.name}' is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def collector(self, func):
+        """
+        Register func() -> iterable of (name, kind, help, [(labels dict, value), ...]).
+        Collectors run only at scrape time, so stats the code already keeps cost nothing extra.
+        """
+        self._collectors.append(func)
+        return func
+
+    def render(self):
+        lines = []
+        for metric in list(self._metrics.values()):
+            family = metric.name + '_total' if metric.kind == 'counter' else metric.name
+            lines.append(f"# HELP {family} {metric.documentation}")
+            lines.append(f"# TYPE {family} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        for collect in self._collectors:
+            try:
+                families = list(collect())
+            except Exception as e:
+                logging.warning(f"Metrics collector {collect.__name__} failed: {e}")
+                continue
+            for name, kind, documentation, samples in families:
+                family = name + '_total' if kind == 'counter' else name
+                lines.append(f"# HELP {family} {documentation}")
+                lines.append(f"# TYPE {family} {kind}")
+                for labels, value in samples:
+                    if value is None:
+                        continue
+                    lines.append(f"{family}{_format_labels(sorted(labels.items()))} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def counter(name, documentation, labelnames=()):
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+def collector(func):
+    return REGISTRY.collector(func)
+
+
+def render():
+    return REGISTRY.render()
+
+
+class _UpstreamTimer:
+    __slots__ = ('latency', 'errors', 'start')
+
+    def __init__(self, latency, errors):
+        self.latency = latency
+        self.errors = errors
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.latency.observe(time.perf_counter() - self.start)
+        if exc_type is not None:
+            self.errors.inc()
+        return False
+
+
+REQUEST_SECONDS = histogram('middleware_request_seconds', 'Request latency by route and status', ('route', 'status'))
+UPSTREAM_SECONDS = histogram('middleware_upstream_request_seconds',
+                             'Latency of calls to Pinecone, Gemini, Dialogflow and the embedding model', ('upstream',))
+UPSTREAM_ERRORS = counter('middleware_upstream_errors', 'Upstream calls that raised', ('upstream',))
+
+
+def upstream(name):
+    """Time the calls to `name` made inside a `with` block, counting exceptions as errors"""
+    return _UpstreamTimer(UPSTREAM_SECONDS.labels(name), UPSTREAM_ERRORS.labels(name))
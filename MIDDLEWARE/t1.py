@@ -1,9 +1,12 @@
 import os
+import logging
 from sentence_transformers import SentenceTransformer
 from sklearn.metrics.pairwise import cosine_similarity
 import google.generativeai as genai
 from pinecone import Pinecone, ServerlessSpec
 from dotenv import load_dotenv
+from metrics import upstream
+from embedding_cache import embedding_cache
 
 load_dotenv()
 
@@ -17,6 +20,8 @@ pc = Pinecone(api_key=Pinecone_API_KEY)
 # Load HuggingFace model
 # model = SentenceTransformer('all-mpnet-base-v2')
 model = SentenceTransformer('BAAI/bge-small-en')
+# Shared with classify_intent in app.py, so both use one model and one cache
+embeddings = embedding_cache(model.encode)
 # --- Setup ---
 
  
@@ -29,22 +34,22 @@ def search(query,INDEX_NAME):
     index = pc.Index(INDEX_NAME)
         
     # 1. Embed the query
-    query_embedding = model.encode([query])[0]
+    query_embedding = embeddings.embed(query)
 
     # 2. Search in Pinecone
-    results = index.query(
-        vector=query_embedding.tolist(), 
-        top_k=7, 
-        include_metadata=True
-    )
+    with upstream('pinecone'):
+        results = index.query(
+            vector=query_embedding.tolist(), 
+            top_k=7, 
+            include_metadata=True
+        )
 
     # 3. Extract matched documents
-    matched_texts = []
-    print("🔎 Top matches:")
-
-    for match in results.matches:
-        print(f"- {match.metadata.get('filename', 'unknown file')}")
-        matched_texts.append(match.metadata.get('text', ''))
+    matched_texts = [match.metadata.get('text', '') for match in results.matches]
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug("Top matches", extra={
+            'route': 'search', 'files': [match.metadata.get('filename', 'unknown file') for match in results.matches],
+        })
 
     # 4. Combine top results
     combined_context = "\n\n".join(matched_texts)
@@ -53,8 +58,9 @@ def search(query,INDEX_NAME):
     gemini_model = genai.GenerativeModel('gemini-1.5-pro')
     prompt = f"Based on this information: '''{combined_context}''', answer the user's question: {query}. Only give the names if asked."
     
-    response = gemini_model.generate_content(prompt)
-    print("\n💬 Gemini Answer:\n", response.text)
+    with upstream('gemini'):
+        response = gemini_model.generate_content(prompt)
+    logging.debug("Gemini answer", extra={'route': 'search', 'answer': response.text})
     return response.text
     
 
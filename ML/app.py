@@ -1,17 +1,39 @@
-from flask import Flask, request, jsonify
-import requests
+from flask import Flask, Response, request, jsonify
 import psycopg2
-from psycopg2.extras import DictCursor 
-from psycopg2 import sql
 from functions.Admission import scrape_admission_details
 from functions.Events import scrape_college_website
-from functions.Library import get_single_book_details, get_book_list, get_single_book_bibilo
+from functions.Library import get_book_list, get_shown_books, get_selected_book_details
 from functions.Papers import handle_search_papers_intent
-from config.database import get_db_connection
+from functions.Slots import get_available_slots_from_api, book_slot_via_api
+from functions.Complaints import (HOSTEL_ROLES, LISTING_CONTEXT, STATUS_VALUES, export_csv, export_xlsx,
+                                  fetch_complaint_page, fetch_complaint_summary, format_complaint_page,
+                                  format_complaint_summary, open_complaint_export, parse_complaint_filters,
+                                  parse_complaint_ids, save_complaint_report, search_complaint_page,
+                                  update_complaints, visible_hostel)
+from functions.ComplaintFeed import complaint_events
+from config.database import get_pool, PoolTimeout
+from utils.dispatch import IntentDispatcher, no_replay
+from utils.deadline import WEBHOOK_BUDGET
+from utils.scheduler import scheduler
+from utils.cache import cache_stats
+from utils.parsing import parse_stats
+from utils.http import client
+from utils.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, render as render_metrics
+from utils.auth import COMPLAINTS_API_SECRET, AuthError, request_token, verify_token
+from utils.log import setup_logging
 from datetime import datetime
+import logging
+import os
+import time
 
 
 app = Flask(__name__)
+setup_logging()
+
+# Scraped pages (events, admissions) are refreshed in the background; set REFRESH_SCHEDULER=0
+# on platforms without long-lived processes (e.g. Vercel) to fall back to fetching per request
+if os.getenv("REFRESH_SCHEDULER", "1") != "0":
+    scheduler.start()
 
 def get_display_info(session_id):
     display_name = session_id.split('_')[1] if 'session_' in session_id else 'unknown'
@@ -33,326 +55,482 @@ def get_display_info(session_id):
     return display_name, role
 
 
+def database_unavailable(error):
+    # Connection errors name the database host; they go to the log, not the chat
+    logging.error(f"Database unavailable: {error}")
+    return {'fulfillmentText': "Failed to connect to the database."}
+
+
+def unhandled_intent(req):
+    return {'fulfillmentText': "Unhandled Intent"}
+
+
+# Every intent answers within WEBHOOK_BUDGET seconds (set it to 0 to wait for handlers indefinitely)
+dispatcher = IntentDispatcher(identify=get_display_info, fallback=unhandled_intent, budget=WEBHOOK_BUDGET)
+
+
 @app.route('/webhook', methods=['POST'])
 def webhook():
-    req = request.get_json(silent=True, force=True)
-    session_full = req.get('session', '')  # Full session string
-    print(session_full)
-    session_id = session_full.split('/')[-1]  # Extract just the ID
-    display_name = session_id.split('_')[1] if 'session_' in session_id else 'unknown'
-    display_name, role = get_display_info(session_id)
-    print(display_name, role)
-    print("Request:", req)
-    intent = req.get('queryResult', {}).get('intent', {}).get('displayName', '')
-    
-    if intent == "GetLatestAnnouncement":
-        latest_info = scrape_college_website()
-        response_text = latest_info if latest_info else "Sorry, I couldn't retrieve the announcement."
-        return jsonify({'fulfillmentText': response_text})    
-    elif intent == "SearchLibraryBooks":
-        book_title = req.get('queryResult', {}).get('parameters', {}).get('book_title', '')
-        if not book_title:
-            return jsonify({'fulfillmentText': "Please provide a book title to search for."})
-        session = req.get('session', '')
-        result = get_book_list(book_title)
-        response = {
-            'fulfillmentText': result,
-            'outputContexts': [
-                {
-                    'name': f"{session}/contexts/SearchLibraryBooks-followup",
-                    'lifespanCount': 0  # Always close followup context by default
-                },
-                {
-                    'name': f"{session}/contexts/awaiting_selection",
-                    'lifespanCount': 0  # Close selection context by default
+    req = dispatcher.parse(request.get_json(silent=True, force=True) or {})
+    start = time.perf_counter()
+    response = dispatcher.dispatch(req)
+    # Sampled per intent through LOG_SAMPLE_RATES; roll numbers are redacted by the formatter
+    logging.info(f"Webhook {req.intent}", extra={
+        'route': req.intent, 'user': req.display_name, 'role': req.role, 'query': req.query_text,
+        'ms': round((time.perf_counter() - start) * 1000, 1),
+    })
+    return jsonify(response)
+
+
+def dashboard_role():
+    """
+    Role from the signed token on a dashboard request (see utils/auth.py), or an
+    error response. The role is never taken from anything the caller can just type in.
+    """
+    if not COMPLAINTS_API_SECRET:
+        return None, (jsonify({'error': "Dashboard access is not configured."}), 503)
+    try:
+        return verify_token(request_token(request)), None
+    except AuthError as e:
+        return None, (jsonify({'error': str(e)}), 401)
+
+
+@app.route('/webhook/stats', methods=['GET'])
+def webhook_stats():
+    """Per-intent latency and error counts, pool and cache state; needs a warden dashboard token"""
+    role, denied = dashboard_role()
+    if denied:
+        return denied
+    if role != "warden":
+        return jsonify({'error': "Only the warden can view webhook stats."}), 403
+    return jsonify({
+        'intents': dispatcher.stats(),
+        'db_pool': get_pool().stats(),
+        'refresh': scheduler.stats(),
+        'caches': cache_stats(),
+        'parsing': parse_stats(),
+        'upstreams': client.stats(),
+    })
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(render_metrics(), content_type=METRICS_CONTENT_TYPE)
+
+
+EXPORT_FORMATS = {
+    'csv': (export_csv, 'text/csv; charset=utf-8'),
+    'xlsx': (export_xlsx, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
+
+
+@app.route('/complaints/export', methods=['GET'])
+def export_complaints():
+    """
+    Complaints as a CSV or XLSX download, streamed in chunks. Takes a dashboard
+    access token (Authorization: Bearer, or ?token=), format=csv|xlsx and the
+    listing filters: hostel, status, date_from, date_to.
+    """
+    role, denied = dashboard_role()
+    if denied:
+        return denied
+    fmt = request.args.get('format', 'xlsx').lower()
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f"Unknown format '{fmt}', use csv or xlsx"}), 400
+    filters = parse_complaint_filters({key: request.args.get(key) for key in ('hostel', 'status', 'date_from', 'date_to')})
+
+    try:
+        hostel = visible_hostel(role, filters['hostel'])
+    except PermissionError as e:
+        return jsonify({'error': str(e)}), 403
+    # Also keeps the Content-Disposition filename below to known values
+    if hostel is not None and hostel not in HOSTEL_ROLES:
+        return jsonify({'error': f"Unknown hostel, use one of {', '.join(HOSTEL_ROLES)}"}), 400
+    try:
+        chunks = open_complaint_export(hostel, filters['status'], filters['date_from'], filters['date_to'])
+    except psycopg2.Error as e:
+        logging.error(f"Complaint export failed: {e}")
+        return jsonify({'error': "Failed to read complaints from the database."}), 503
+
+    write, mimetype = EXPORT_FORMATS[fmt]
+    filename = f"complaints-{(hostel or 'all').lower()}-{datetime.now():%Y%m%d}.{fmt}"
+    return Response(write(chunks), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+
+@app.route('/complaints/stream', methods=['GET'])
+def stream_complaints():
+    """
+    New complaints pushed as server-sent events as soon as they are saved, for
+    the caller's hostel (the warden gets all of them, or ?hostel=BHn). Takes a
+    dashboard access token like /complaints/export; EventSource can't set headers,
+    so browsers pass it as ?token=. Each open stream holds a worker, so this needs
+    the gevent workers from gunicorn.conf.py.
+    """
+    role, denied = dashboard_role()
+    if denied:
+        return denied
+    try:
+        hostel = visible_hostel(role, request.args.get('hostel'))
+    except PermissionError as e:
+        return jsonify({'error': str(e)}), 403
+    return Response(complaint_events([hostel] if hostel else HOSTEL_ROLES), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@dispatcher.intent("GetLatestAnnouncement")
+def latest_announcement(req):
+    latest_info = scrape_college_website()
+    if not latest_info:
+        no_replay()
+        return {'fulfillmentText': "Sorry, I couldn't retrieve the announcement."}
+    return {'fulfillmentText': latest_info}
+
+
+@dispatcher.intent("SearchLibraryBooks")
+def search_library_books(req):
+    book_title = req.param('book_title')
+    if not book_title:
+        return {'fulfillmentText': "Please provide a book title to search for."}
+    session = req.session
+    result = get_book_list(book_title, req.session_id)
+    response = {
+        'fulfillmentText': result,
+        'outputContexts': [
+            {
+                'name': f"{session}/contexts/SearchLibraryBooks-followup",
+                'lifespanCount': 0  # Always close followup context by default
+            },
+            {
+                'name': f"{session}/contexts/awaiting_selection",
+                'lifespanCount': 0  # Close selection context by default
+            }
+        ]
+    }
+    if "Title:" in result:  # Single book case
+        pass
+    elif any(no_result_msg in result for no_result_msg in [
+        "No matching books found",
+        "No books found", 
+        "No books found matching your search",
+        "The search returned no results",
+        "No results found"
+    ]): 
+        pass
+    else:  # Multiple books case
+        response['outputContexts'] = [
+            {
+                'name': f"{session}/contexts/awaiting_selection",
+                'lifespanCount': 1,  # Keep context open for selection
+                'parameters': {
+                    'original_query': book_title,
+                    'search_results': result,
+                    # Lets any worker resolve the pick even if its local copy expired
+                    'search_records': [
+                        {k: b.get(k) for k in ('title', 'author', 'biblionumber')}
+                        for b in get_shown_books(req.session_id) or []
+                    ]
                 }
-            ]
-        }
-        if "Title:" in result:  # Single book case
-            pass
-        elif any(no_result_msg in result for no_result_msg in [
-            "No matching books found",
-            "No books found", 
-            "No books found matching your search",
-            "The search returned no results",
-            "No results found"
-        ]): 
-            pass
-        else:  # Multiple books case
-            response['outputContexts'] = [
-                {
-                    'name': f"{session}/contexts/awaiting_selection",
-                    'lifespanCount': 1,  # Keep context open for selection
-                    'parameters': {
-                        'original_query': book_title,
-                        'search_results': result
-                    }
-                },
+            },
+            {
+                'name': f"{session}/contexts/SearchLibraryBooks-followup", 
+                'lifespanCount': 1  # Keep followup context open
+            }
+        ]
+    return response
+
+
+@dispatcher.intent("SelectBookFromList")
+def select_book_from_list(req):
+    book_choice = req.param('book_choice')
+    biblo_choice = req.param('biblo_choice')
+
+    if book_choice or biblo_choice:
+        # Resolved against the list we just showed (by number, title or biblionumber),
+        # so at most the one detail page is fetched
+        shown_books = (req.context('awaiting_selection') or {}).get('search_records')
+        details = get_selected_book_details(req.session_id, book_choice, biblo_choice, shown_books)
+        return {"fulfillmentText": details}
+    else:
+        return {'fulfillmentText': "Please provide a book title to search for."}
+
+
+@dispatcher.intent("SearchPapers")
+def search_papers(req):
+    return handle_search_papers_intent(req.raw)
+
+
+@dispatcher.intent("AdmissionData")
+def admission_data(req):
+    admission_choice = req.param('admission_choice').strip()
+
+    if admission_choice.lower() == 'exit info':
+        return {
+            "fulfillmentText": "Exiting admission information. Type 'Admission Info' to start again.",
+            "outputContexts": [
                 {
-                    'name': f"{session}/contexts/SearchLibraryBooks-followup", 
-                    'lifespanCount': 1  # Keep followup context open
+                    "name": req.context_name("AdmissionDetails-followup"),
+                    "lifespanCount": 0
                 }
             ]
-        return jsonify(response)
-
-    elif intent == "SelectBookFromList":
-        parameters = req.get('queryResult', {}).get('parameters', {})
-        book_choice = parameters.get('book_choice', '')
-        biblo_choice = parameters.get('biblo_choice', '')
-        
-        if book_choice and not biblo_choice:
-            # User selected by book title/number only
-            details = get_single_book_details(book_choice)
-            return {"fulfillmentText": details}
-        elif biblo_choice:
-            # User included biblionumber (handle as needed)
-            details = get_single_book_bibilo(book_choice, biblo_choice)
-            return {"fulfillmentText": details}
+        }
+    elif admission_choice:
+        details = scrape_admission_details(admission_choice)
+        return {"fulfillmentText": details}
+    else:
+        return {'fulfillmentText': "Please provide admission choice to search for."}
+
+
+@dispatcher.intent("Complaint - custom", replay=False)
+def save_complaint(req):
+    complaint_data = req.param('complaint_text', [])
+
+    if isinstance(complaint_data, list) and len(complaint_data) == 1:
+        parts = [x.strip() for x in complaint_data[0].split(',')]
+        if len(parts) >= 4: 
+            # Extract parts and convert hostel to lowercase
+            complaint = parts[0]
+            hostel = parts[1].strip().upper()  # Ensure hostel is lowercase
+            room_no = parts[2]
+            date = parts[3]
+
+            try:
+                complaint_id, reporters = save_complaint_report(complaint, hostel, room_no, date, req.role)
+                if reporters > 1:
+                    return {'fulfillmentText': f"This issue is already reported as complaint #{complaint_id}; "
+                                               f"your report was added to it ({reporters} reports so far)."}
+                # Return success message here after successful insertion
+                return {'fulfillmentText': "Complaint saved successfully!"}
+            except (PoolTimeout, psycopg2.OperationalError) as e:
+                return database_unavailable(e)
+            except psycopg2.Error as e:
+                return {'fulfillmentText': f"Database error: {str(e)}"}
         else:
-            return jsonify({'fulfillmentText': "Please provide a book title to search for."})
+            # Not enough parts provided
+            return {'fulfillmentText': "Please provide full complaint details: issue, hostel, room, date."}
+    else:
+        # Invalid complaint_data format
+        return {'fulfillmentText': "Invalid complaint format. Please provide data as a list with one string."}
 
-    elif intent == "SearchPapers":
-        return handle_search_papers_intent(req)
-        
 
-    elif intent == "AdmissionData":
-        parameters = req.get('queryResult', {}).get('parameters', {})
-        admission_choice = parameters.get('admission_choice', '').strip()
+@dispatcher.intent("complain-Data", replay=False)
+def list_complaints(req):
+    return complaint_listing(req, parse_complaint_filters(req.parameters))
 
-        session = req.get('session', '')
-        
-        if admission_choice.lower() == 'exit info':
-            return {
-                "fulfillmentText": "Exiting admission information. Type 'Admission Info' to start again.",
-                "outputContexts": [
-                    {
-                        "name": f"{session}/contexts/AdmissionDetails-followup",
-                        "lifespanCount": 0
-                    }
-                ]
-            }
-        elif admission_choice:
-            details = scrape_admission_details(admission_choice)
-            return {"fulfillmentText": details}
-        else:
-            return jsonify({'fulfillmentText': "Please provide admission choice to search for."})
-    
-    elif intent == "Complaint - custom":
-        parameters = req.get('queryResult', {}).get('parameters', {})
-        complaint_data = parameters.get('complaint_text', [])
-
-        if isinstance(complaint_data, list) and len(complaint_data) == 1:
-            parts = [x.strip() for x in complaint_data[0].split(',')]
-            if len(parts) >= 4: 
-                # Extract parts and convert hostel to lowercase
-                complaint = parts[0]
-                hostel = parts[1].strip().upper()  # Ensure hostel is lowercase
-                room_no = parts[2]
-                date = parts[3]
-
-                conn = get_db_connection()
-                # conn=False
-                if conn:
-                    try:
-                        with conn.cursor() as cursor:
-                            insert_query = """
-                            INSERT INTO complaint (complaint, hostel, room_no, date, issue_solved, roll_no)
-                            VALUES (%s, %s, %s, %s, %s, %s);
-                            """
-                            cursor.execute(insert_query, (complaint, hostel, room_no, date, False, role))
-                            conn.commit()
-                            # Return success message here after successful insertion
-                            return jsonify({'fulfillmentText': "Complaint saved successfully!"})    
-                    except psycopg2.Error as e:
-                        return jsonify({'fulfillmentText': f"Database error: {str(e)}"})
-                    finally:
-                        conn.close()
-    
-                else:
-                    # Handle database connection failure
-                    return jsonify({'fulfillmentText': "Failed to connect to the database."})
-            else:
-                # Not enough parts provided
-                return jsonify({'fulfillmentText': "Please provide full complaint details: issue, hostel, room, date."})
-        else:
-            # Invalid complaint_data format
-            return jsonify({'fulfillmentText': "Invalid complaint format. Please provide data as a list with one string."})
-        
-    elif intent == "complain-Data":
-        parameters = req.get('queryResult', {}).get('parameters', {})
-
-        if role:
-            conn = get_db_connection()
-            if conn:
-                try:
-                    with conn.cursor() as cursor:
-                        # Warden can see all complaints
-                        if role == "warden":
-                            select_query = """
-                            SELECT roll_no, complaint, room_no, date, hostel 
-                            FROM complaint;
-                            """
-                            cursor.execute(select_query)
-
-                        # Hostel support can see only their own hostel complaints
-                        elif role in ["BH1", "BH2", "BH3", "BH4", "BH5"]:
-                            select_query = """
-                            SELECT roll_no, complaint, room_no, date, hostel 
-                            FROM complaint
-                            WHERE hostel = %s;
-                            """
-                            cursor.execute(select_query, (role.upper(),))  # Hostel names likely stored in uppercase
-
-                        else:
-                            return jsonify({'fulfillmentText': "You do not have permission to view complaints."})
-
-                        rows = cursor.fetchall()
-
-                        if not rows:
-                            return jsonify({'fulfillmentText': "No complaints found."})
-
-                        # Format each complaint
-                        response_lines = []
-                        for idx, row in enumerate(rows, start=1):
-                            roll_no, complaint, room_no, date, hostel = row
-                            response_lines.append(
-                                f"Complaint {idx}: {complaint}, Room: {room_no}, Hostel: {hostel}, Date: {date}, Filed by: {roll_no}"
-                            )
-
-                        response_text = "\n".join(response_lines)
-                        return jsonify({'fulfillmentText': response_text})
-
-                except psycopg2.Error as e:
-                    return jsonify({'fulfillmentText': f"Database error: {str(e)}"})
-
-                finally:
-                    conn.close()
-        else:
-            return jsonify({'fulfillmentText': "Please specify your role or hostel name to search for complaints."})
 
-    elif intent == "ViewAvailableSlots":
-        parameters = req.get('queryResult', {}).get('parameters', {})
-        
-        # Get parameters from the chatbot request
-        faculty_id = parameters.get('last-name')
-        date = parameters.get('date') # This will be in YYYY-MM-DDTHH:MM:SS format
-        print("vraj")
-        print(faculty_id)
-        print(date)
-        if date:
-            # Truncate date parameter to match Spring Boot format (YYYY-MM-DD)
-            date = date.split('T')[0]
-        
-        if not faculty_id or not date:
-            # Should be handled by Dialogflow if parameters are required, but good check
-            return jsonify({'fulfillmentText': "Please provide a faculty ID and date."})
+@dispatcher.intent("complain-Data - next", replay=False)
+def list_more_complaints(req):
+    listing = req.context(LISTING_CONTEXT)
+    if not listing or not listing.get('cursor'):
+        return {'fulfillmentText': "There are no more complaints to show."}
+    return complaint_listing(req, listing.get('filters') or {}, listing['cursor'], int(listing.get('shown', 0)))
 
-        response_text = get_available_slots_from_api(faculty_id, date)
-        
-        # If slots are available, set context to await selection
-        if "Here are the available slots" in response_text:
-            return jsonify({
-                'fulfillmentText': response_text,
-                'outputContexts': [
-                    {
-                        'name': f"{session_full}/contexts/awaiting_slot_selection",
-                        'lifespanCount': 2,
-                        'parameters': {
-                            'faculty_id': faculty_id,
-                            'date': date
-                        }
-                    }
-                ]
-            })
-        else:
-            return jsonify({'fulfillmentText': response_text})
 
+@dispatcher.intent("complain-Search", replay=False)
+def search_complaints(req):
+    """Ranked full-text search ("wifi in BH3 this month"), paged on by the complain-Data - next intent"""
+    filters = parse_complaint_filters(req.parameters)
+    if not filters['query']:
+        return {'fulfillmentText': "What should I search the complaints for?"}
+    return complaint_listing(req, filters)
 
-   
 
+@dispatcher.intent("complain-Update", replay=False)
+def bulk_update_complaints(req):
+    """Mark many complaints resolved/open, or move them to another hostel, in one statement"""
+    role = req.role
+    if not role:
+        return {'fulfillmentText': "Please specify your role or hostel name to update complaints."}
 
+    ids = parse_complaint_ids(req.param('complaint_ids'))
+    status = str(req.param('status') or '').strip().lower()
+    solved = STATUS_VALUES.get(status)
+    new_hostel = str(req.param('hostel') or '').strip().upper() or None
+    try:
+        updated, skipped = update_complaints(role, ids, solved, new_hostel)
+    except (PermissionError, ValueError) as e:
+        return {'fulfillmentText': str(e)}
+    except psycopg2.errors.UniqueViolation:
+        # The same issue was reported again between the clash check and the update
+        return {'fulfillmentText': "Some of these complaints were reported again and are already open, "
+                                   "so they can't be reopened. Nothing was changed."}
+    except (PoolTimeout, psycopg2.OperationalError) as e:
+        return database_unavailable(e)
+    except psycopg2.Error as e:
+        return {'fulfillmentText': f"Database error: {str(e)}"}
+
+    changes = []
+    if solved is not None:
+        changes.append("marked resolved" if solved else "reopened")
+    if new_hostel:
+        changes.append(f"moved to {new_hostel}")
+    text = f"{updated} of {len(ids)} complaints {' and '.join(changes)}."
+    if skipped:
+        text += (f" Not reopened: {', '.join(f'#{i}' for i in skipped)}, because the same issue "
+                 "was reported again and is already open as another complaint.")
+    if updated + len(skipped) < len(ids):
+        text += " The rest were not found, are not in your hostel, or already had that status."
+    return {'fulfillmentText': text}
+
+
+def complaint_listing(req, filters, cursor=None, shown=0):
+    """
+    One page of complaints the caller's role may see (ranked search results when
+    filters has a query), with the cursor for the next page in a context
+    """
+    role = req.role
+    if not role:
+        return {'fulfillmentText': "Please specify your role or hostel name to search for complaints."}
 
+    try:
+        # Re-checked on every page, so filters coming back in the context can't widen the scope
+        hostel = visible_hostel(role, filters.get('hostel'))
+        if filters.get('query'):
+            rows, next_cursor = search_complaint_page(filters['query'], hostel, filters.get('status'),
+                                                      filters.get('date_from'), filters.get('date_to'), cursor)
+        else:
+            rows, next_cursor = fetch_complaint_page(hostel, filters.get('status'), filters.get('date_from'),
+                                                     filters.get('date_to'), cursor)
+    except PermissionError as e:
+        return {'fulfillmentText': str(e)}
+    except (PoolTimeout, psycopg2.OperationalError) as e:
+        return database_unavailable(e)
+    except psycopg2.Error as e:
+        return {'fulfillmentText': f"Database error: {str(e)}"}
+
+    if not rows:
+        return {'fulfillmentText': "No more complaints found." if cursor else "No complaints found."}
+
+    return {
+        'fulfillmentText': format_complaint_page(rows, start=shown + 1, has_more=next_cursor is not None),
+        'outputContexts': [
+            {
+                'name': req.context_name(LISTING_CONTEXT),
+                'lifespanCount': 2 if next_cursor else 0,
+                'parameters': {'cursor': next_cursor, 'filters': filters, 'shown': shown + len(rows)},
+            }
+        ]
+    }
 
 
+@dispatcher.intent("complain-Summary", replay=False)
+def summarize_complaints(req):
+    """Open/resolved counts, daily totals and top repeated issues from the summary tables"""
+    role = req.role
+    if not role:
+        return {'fulfillmentText': "Please specify your role or hostel name to see the complaint summary."}
 
-# This intent handles the user selecting one of the slots (e.g., "book 10:30-11:00")
-    elif intent == "ConfirmSlotBooking":
-        parameters = req.get('queryResult', {}).get('parameters', {})
-        
-        # Get parameters from the context set above (from ViewAvailableSlots intent)
-        context_params = {}
-        session_full = req.get('session')
-        
-        for context in req.get('queryResult', {}).get('outputContexts', []):
-            if 'awaiting_slot_selection' in context['name']:
-                context_params = context['parameters']
-                break
-        
-        # 1. Get Faculty ID and Date from the context
-        faculty_id = context_params.get('faculty_id')
-        date = context_params.get('date') 
-        
-        # 2. Get the actual slot selection (the ID) from the current user input
-        slot_range = parameters.get('slot_range') # e.g., "10:30-11:00"
-    
-        # Use the full range as the primary slot ID
-        slot_id = slot_range 
-    
-        if not faculty_id or not date or not slot_id:
-            # If essential data is missing, fail and close context
-            return jsonify({
-                'fulfillmentText': "I seem to have lost the booking details. Please start over.",
-                'outputContexts': [{'name': f"{session_full}/contexts/awaiting_slot_selection", 'lifespanCount': 0}]
-            })
+    filters = parse_complaint_filters(req.parameters)
+    try:
+        hostel = visible_hostel(role, filters['hostel'])
+        summary = fetch_complaint_summary(hostel, filters['date_from'], filters['date_to'])
+    except PermissionError as e:
+        return {'fulfillmentText': str(e)}
+    except (PoolTimeout, psycopg2.OperationalError) as e:
+        return database_unavailable(e)
+    except psycopg2.Error as e:
+        return {'fulfillmentText': f"Database error: {str(e)}"}
+
+    return {'fulfillmentText': format_complaint_summary(summary, hostel)}
+
+
+@dispatcher.intent("ViewAvailableSlots")
+def view_available_slots(req):
+    # Get parameters from the chatbot request
+    faculty_id = req.param('last-name', None)
+    date = req.param('date', None) # This will be in YYYY-MM-DDTHH:MM:SS format
+    logging.debug("Slots requested for faculty=%s date=%s", faculty_id, date)
+    if date:
+        # Truncate date parameter to match Spring Boot format (YYYY-MM-DD)
+        date = date.split('T')[0]
     
-        # --- NEW LOGIC TO SATISFY BookingRequest FIELDS ---
-        try:
-            # Extract start and end times from the slot range
-            start_time, end_time = slot_id.split('-')
-            
-            # Calculate duration in minutes (required by the Java class)
-            duration = calculate_duration_minutes(start_time, end_time)
-            
-        except ValueError:
-            # Handle case where slot_id is not in the expected format (e.g., "10:30")
-            return jsonify({'fulfillmentText': "Invalid slot format received. Please try again."})
-        
-        # 3. Use the 'role' derived from the session as the student identifier (studentUid)
-        student_uid = role 
-        
-        # 4. Define the COMPLETE payload matching the required Java BookingRequest structure
-        payload = {
-            "facultyId": faculty_id,
-            "date": date,
-            "slotId": slot_id,
-            "studentUid": student_uid,
-            "duration": duration,   # Added
-            "startTime": start_time,# Added
-            "endTime": end_time     # Added
-        }
-        
-        # NOTE: The book_slot_via_api function signature needs to change to accept this payload.
-        # Assuming the API call handles packaging the data correctly.
-        # We will pass the full payload dictionary:
-        response_text = book_slot_via_api(payload) # Changed to accept one payload dictionary
+    if not faculty_id or not date:
+        # Should be handled by Dialogflow if parameters are required, but good check
+        return {'fulfillmentText': "Please provide a faculty ID and date."}
+
+    response_text = get_available_slots_from_api(faculty_id, date)
     
-        # Remove the context after booking attempt (success or failure)
-        return jsonify({
+    # If slots are available, set context to await selection
+    if "Here are the available slots" in response_text:
+        return {
             'fulfillmentText': response_text,
             'outputContexts': [
                 {
-                    'name': f"{session_full}/contexts/awaiting_slot_selection",
-                    'lifespanCount': 0 # Close the context
+                    'name': req.context_name("awaiting_slot_selection"),
+                    'lifespanCount': 2,
+                    'parameters': {
+                        'faculty_id': faculty_id,
+                        'date': date
+                    }
                 }
             ]
-        })
-
+        }
     else:
-        return jsonify({'fulfillmentText': "Unhandled Intent"})
+        return {'fulfillmentText': response_text}
 
 
+# This intent handles the user selecting one of the slots (e.g., "book 10:30-11:00")
+@dispatcher.intent("ConfirmSlotBooking", replay=False)
+def confirm_slot_booking(req):
+    # Get parameters from the context set above (from ViewAvailableSlots intent)
+    context_params = req.context('awaiting_slot_selection') or {}
+    
+    # 1. Get Faculty ID and Date from the context
+    faculty_id = context_params.get('faculty_id')
+    date = context_params.get('date') 
+    
+    # 2. Get the actual slot selection (the ID) from the current user input
+    slot_range = req.param('slot_range', None) # e.g., "10:30-11:00"
+
+    # Use the full range as the primary slot ID
+    slot_id = slot_range 
+
+    if not faculty_id or not date or not slot_id:
+        # If essential data is missing, fail and close context
+        return {
+            'fulfillmentText': "I seem to have lost the booking details. Please start over.",
+            'outputContexts': [{'name': req.context_name("awaiting_slot_selection"), 'lifespanCount': 0}]
+        }
+
+    # --- NEW LOGIC TO SATISFY BookingRequest FIELDS ---
+    try:
+        # Extract start and end times from the slot range
+        start_time, end_time = slot_id.split('-')
+        
+        # Calculate duration in minutes (required by the Java class)
+        duration = calculate_duration_minutes(start_time, end_time)
+        
+    except ValueError:
+        # Handle case where slot_id is not in the expected format (e.g., "10:30")
+        return {'fulfillmentText': "Invalid slot format received. Please try again."}
+    
+    # 3. Use the 'role' derived from the session as the student identifier (studentUid)
+    student_uid = req.role 
+    
+    # 4. Define the COMPLETE payload matching the required Java BookingRequest structure
+    payload = {
+        "facultyId": faculty_id,
+        "date": date,
+        "slotId": slot_id,
+        "studentUid": student_uid,
+        "duration": duration,   # Added
+        "startTime": start_time,# Added
+        "endTime": end_time     # Added
+    }
+    
+    response_text = book_slot_via_api(payload)
+
+    # Remove the context after booking attempt (success or failure)
+    return {
+        'fulfillmentText': response_text,
+        'outputContexts': [
+            {
+                'name': req.context_name("awaiting_slot_selection"),
+                'lifespanCount': 0 # Close the context
+            }
+        ]
+    }
 
-SLOTS_API_BASE_URL = 'https://facultyslots.onrender.com/api/slots'
 
 # Helper function to calculate duration in minutes
 def calculate_duration_minutes(start_str, end_str):
@@ -374,56 +552,6 @@ def calculate_duration_minutes(start_str, end_str):
 
 
 
-def get_available_slots_from_api(faculty_id, date):
-    """Calls Spring Boot GET endpoint to fetch available slots."""
-    try:
-        url = f"{SLOTS_API_BASE_URL}?facultyId={faculty_id}&date={date}"
-        response = requests.get(url)
-        response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
-        
-        slots = response.json()
-        
-        if not slots:
-            return "I found no available slots for that date."
-            
-        # Format slots for the user
-        response_text = "Here are the available slots:\n"
-        for idx, slot in enumerate(slots, 1):
-            response_text += f"{idx}. {slot.get('start')} - {slot.get('end')}\n"
-            
-        return response_text
-        
-    except requests.exceptions.RequestException as e:
-        print(f"API Error fetching slots: {e}")
-        return "I'm sorry, I couldn't connect to the booking system right now."
-
-
-def book_slot_via_api(payload):
-    """Calls Spring Boot POST endpoint to book a slot."""
-    try:
-        url = f"{SLOTS_API_BASE_URL}/book"
-        
-        
-        response = requests.post(url, json=payload)
-        
-        if response.status_code == 200:
-            return "Your slot has been successfully booked!"
-        
-        elif response.status_code == 409:
-            # Conflict status from Spring Boot (e.g., slot already booked)
-            error_data = response.json()
-            return f"Booking failed: {error_data.get('error', 'The slot is no longer available.')}"
-            
-        else:
-            # General API error
-            error_data = response.json()
-            return f"An error occurred while confirming the booking. Code {response.status_code}. {error_data.get('error', '')}"
-
-    except requests.exceptions.RequestException as e:
-        print(f"API Error booking slot: {e}")
-        return "I'm sorry, there was a system error when trying to book."
-
-
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
 
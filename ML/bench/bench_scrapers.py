@@ -0,0 +1,207 @@
+"""
+Offline benchmark of every scraper's parse/extract step against recorded HTML.
+
+    python -m bench.bench_scrapers                    # run and compare with bench/baseline.json
+    python -m bench.bench_scrapers --update-baseline  # store this run as the new baseline
+    python -m bench.bench_scrapers --check            # exit 1 if any case regressed
+    python -m bench.bench_scrapers --record           # fetch live pages into a new fixtures/vN
+
+No network is used except with --record. Fixtures are versioned under
+bench/fixtures/vN with a manifest of source URLs, sha256 checksums and each
+page's origin; a checksum mismatch aborts the run, since timings against edited
+HTML aren't comparable. Cases reading a fixture whose origin isn't "recorded"
+(hand-written stand-ins for pages that couldn't be fetched) are marked synthetic:
+they still run, but stay out of the baseline and --check. Baselines are machine
+specific - regenerate on the reference box.
+"""
+import argparse
+import gc
+import hashlib
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+os.environ.setdefault("REFRESH_SCHEDULER", "0")
+
+from functions import Admission, Events, Library, Papers  # noqa: E402
+from utils.parsing import parse_html  # noqa: E402
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(BENCH_DIR, "fixtures")
+BASELINE_PATH = os.path.join(BENCH_DIR, "baseline.json")
+
+SOURCES = {
+    "koha_search.html": "https://lnmiit-opac.kohacloud.in/cgi-bin/koha/opac-search.pl?idx=&limit=&q=introduction+to+algorithms&limit=&weight_search=1",
+    "koha_record.html": "https://lnmiit-opac.kohacloud.in/cgi-bin/koha/opac-detail.pl?biblionumber=2100",
+    "dspace_browse.html": f"{Papers.BASE_URL}/handle/123456789/8/browse?type=title&sort_by=1&order=ASC&rpp=20&etal=-1&starts_with=a",
+    "events.html": Events.EVENTS_URL,
+    "admissions.html": Admission.ADMISSION_URL,
+}
+
+
+def latest_version():
+    versions = [int(d[1:]) for d in os.listdir(FIXTURES_DIR) if d.startswith("v") and d[1:].isdigit()]
+    return max(versions)
+
+
+def load_fixtures(version):
+    """Fixture contents by name, and the names of those recorded from the live site"""
+    directory = os.path.join(FIXTURES_DIR, f"v{version}")
+    with open(os.path.join(directory, "manifest.json")) as f:
+        manifest = json.load(f)
+    fixtures = {}
+    recorded = set()
+    for name, meta in manifest["fixtures"].items():
+        with open(os.path.join(directory, name), "rb") as f:
+            content = f.read()
+        if hashlib.sha256(content).hexdigest() != meta["sha256"]:
+            sys.exit(f"Fixture {name} in v{version} does not match its checksum; record a new version instead of editing it")
+        fixtures[name] = content
+        if meta.get("origin") == "recorded":
+            recorded.add(name)
+    return fixtures, recorded
+
+
+def build_cases(fx):
+    """(case name, fixtures read, callable) triples; each callable does parse + extract only"""
+    admissions_soup = parse_html(fx["admissions.html"], name="bench")
+    record_soup = parse_html(fx["koha_record.html"], name="bench")
+    books = Library.parse_search_results(fx["koha_search.html"])["books"]
+    papers = Papers.parse_papers(fx["dspace_browse.html"].decode("utf-8"))
+    sections = Admission.render_admission_sections(fx["admissions.html"])
+
+    cases = [
+        ("Library.parse_search_results[list]", "koha_search.html", lambda: Library.parse_search_results(fx["koha_search.html"])),
+        ("Library.parse_search_results[record]", "koha_record.html", lambda: Library.parse_search_results(fx["koha_record.html"])),
+        ("Library.parse_record_page", "koha_record.html", lambda: Library.parse_record_page(fx["koha_record.html"])),
+        ("Library.get_book_info", "koha_record.html", lambda: Library.get_book_info(record_soup)),
+        ("Library.format_book_list", "koha_search.html", lambda: Library.format_book_list(books, "All books in search results")),
+        ("Papers.parse_papers", "dspace_browse.html", lambda: Papers.parse_papers(fx["dspace_browse.html"].decode("utf-8"))),
+        ("Papers.format_papers_response", "dspace_browse.html", lambda: Papers.format_papers_response(papers, "a")),
+        ("Events.parse_college_events", "events.html", lambda: Events.parse_college_events(fx["events.html"])),
+        ("Admission.render_admission_sections", "admissions.html", lambda: Admission.render_admission_sections(fx["admissions.html"])),
+        ("Admission.format_admission_sections", "admissions.html", lambda: Admission.format_admission_sections(sections, "Fee Structure")),
+    ]
+    # Extract-only cost of each section against an already parsed page
+    for title, func in Admission.section_functions.items():
+        cases.append((f"Admission.{func.__name__}", "admissions.html", lambda func=func: func(admissions_soup)))
+    return cases
+
+
+def measure(func, repeat):
+    func()  # warm up
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    result = func()
+    _, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, "filename") if stat.count_diff > 0)
+    del result
+
+    return {
+        "median_ms": round(statistics.median(timings) * 1000, 3),
+        "min_ms": round(min(timings) * 1000, 3),
+        "peak_kb": round(peak / 1024, 1),
+        "alloc_blocks": blocks,
+    }
+
+
+def record(version):
+    from utils.http import client
+
+    directory = os.path.join(FIXTURES_DIR, f"v{version}")
+    os.makedirs(directory)
+    manifest = {"version": version, "fixtures": {}}
+    for name, url in SOURCES.items():
+        response = client.get(url, verify=False)
+        response.raise_for_status()
+        with open(os.path.join(directory, name), "wb") as f:
+            f.write(response.content)
+        manifest["fixtures"][name] = {
+            "url": url,
+            "origin": "recorded",
+            "sha256": hashlib.sha256(response.content).hexdigest(),
+        }
+        print(f"recorded {name} ({len(response.content)} bytes)")
+    with open(os.path.join(directory, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+        f.write("\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixtures", type=int, help="fixture version (default: latest)")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--filter", default="", help="only run cases containing this text")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--check", action="store_true", help="exit 1 when a case is slower than --tolerance x baseline")
+    parser.add_argument("--tolerance", type=float, default=1.25)
+    parser.add_argument("--min-delta", type=float, default=0.05,
+                        help="ignore slowdowns smaller than this many ms (timer noise on tiny cases)")
+    parser.add_argument("--record", action="store_true", help="fetch live pages into a new fixture version")
+    args = parser.parse_args()
+
+    if args.record:
+        record(latest_version() + 1)
+        return
+
+    version = args.fixtures or latest_version()
+    fixtures, recorded = load_fixtures(version)
+    cases = [c for c in build_cases(fixtures) if args.filter in c[0]]
+
+    baseline = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as f:
+            stored = json.load(f)
+        if stored.get("fixtures") == version:
+            baseline = stored["cases"]
+
+    results = {}
+    regressions = []
+    unchecked = []
+    print(f"fixtures v{version}, {args.repeat} runs per case\n")
+    print(f"{'case':48} {'median ms':>10} {'min ms':>9} {'peak KB':>9} {'blocks':>8} {'vs base':>9}")
+    for name, fixture, func in cases:
+        result = measure(func, args.repeat)
+        ratio = "synthetic"
+        if fixture in recorded:
+            results[name] = result
+            ratio = ""
+            base = baseline.get(name)
+            if not base or not base["median_ms"]:
+                unchecked.append(name)
+            else:
+                change = result["median_ms"] / base["median_ms"]
+                ratio = f"{change:.2f}x"
+                if change > args.tolerance and result["median_ms"] - base["median_ms"] > args.min_delta:
+                    regressions.append(name)
+        print(f"{name:48} {result['median_ms']:>10.3f} {result['min_ms']:>9.3f} "
+              f"{result['peak_kb']:>9.1f} {result['alloc_blocks']:>8} {ratio:>9}")
+
+    if args.update_baseline:
+        with open(BASELINE_PATH, "w") as f:
+            json.dump({"fixtures": version, "cases": results}, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nbaseline written to {BASELINE_PATH}")
+        return
+    if regressions:
+        print(f"\n{len(regressions)} case(s) slower than {args.tolerance}x baseline: {', '.join(regressions)}")
+    if unchecked:
+        print(f"\n{len(unchecked)} case(s) have no baseline for fixtures v{version}: {', '.join(unchecked)}")
+    if args.check and (regressions or unchecked):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
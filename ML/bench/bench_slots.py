@@ -0,0 +1,56 @@
+"""
+Offline benchmark of the slots client against the local stand-in.
+
+    python -m bench.bench_slots --latency 1.0 --lookups 200 --faculties 5
+
+Replays availability lookups for a few professors/dates with an occasional
+booking, and reports latency percentiles, upstream calls and cache hit rate.
+"""
+import argparse
+import os
+import random
+import time
+
+from bench.fake_slots import start_server
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(round(p / 100.0 * (len(samples) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--lookups", type=int, default=100)
+    parser.add_argument("--faculties", type=int, default=5)
+    parser.add_argument("--book-every", type=int, default=10, help="book a slot after every N lookups")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    server, state = start_server(latency=args.latency)
+    os.environ["SLOTS_API_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}/api/slots"
+    # Imported after the base URL is pointed at the stand-in
+    from functions.Slots import get_available_slots_from_api, book_slot_via_api, _availability_cache
+
+    rng = random.Random(args.seed)
+    keys = [(f"prof{i}", "2026-01-15") for i in range(args.faculties)]
+    timings = []
+    for n in range(1, args.lookups + 1):
+        faculty_id, date = rng.choice(keys)
+        start = time.perf_counter()
+        get_available_slots_from_api(faculty_id, date)
+        timings.append(time.perf_counter() - start)
+        if args.book_every and n % args.book_every == 0:
+            book_slot_via_api({"facultyId": faculty_id, "date": date, "slotId": "10:00-10:30",
+                               "studentUid": "BENCH", "duration": 30, "startTime": "10:00", "endTime": "10:30"})
+
+    server.shutdown()
+    stats = _availability_cache.stats()
+    print(f"lookups={args.lookups} upstream_requests={state.requests} hit_rate={stats['hit_rate']}")
+    print(f"p50={percentile(timings, 50) * 1000:.1f}ms p95={percentile(timings, 95) * 1000:.1f}ms "
+          f"p99={percentile(timings, 99) * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Local stand-in for the faculty slots API (GET /api/slots, POST /api/slots/book).
+
+    python -m bench.fake_slots --port 8081 --latency 1.5
+
+then run the webhook with SLOTS_API_BASE_URL=http://127.0.0.1:8081/api/slots
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+DEFAULT_SLOTS = [
+    ("10:00", "10:30"), ("10:30", "11:00"), ("11:00", "11:30"),
+    ("14:00", "14:30"), ("14:30", "15:00"), ("15:00", "15:30"),
+]
+
+
+class SlotsState:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.booked = set()  # (facultyId, date, slotId)
+        self.lock = threading.Lock()
+        self.requests = 0
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def _reply(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            if url.path.rstrip('/') != "/api/slots":
+                return self._reply(404, {"error": "not found"})
+            with state.lock:
+                state.requests += 1
+            time.sleep(state.latency)
+            query = parse_qs(url.query)
+            faculty_id = query.get("facultyId", [""])[0]
+            date = query.get("date", [""])[0]
+            with state.lock:
+                free = [
+                    {"start": start, "end": end}
+                    for start, end in DEFAULT_SLOTS
+                    if (faculty_id, date, f"{start}-{end}") not in state.booked
+                ]
+            self._reply(200, free)
+
+        def do_POST(self):
+            if urlsplit(self.path).path.rstrip('/') != "/api/slots/book":
+                return self._reply(404, {"error": "not found"})
+            with state.lock:
+                state.requests += 1
+            time.sleep(state.latency)
+            length = int(self.headers.get("Content-Length") or 0)
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            key = (payload.get("facultyId"), payload.get("date"), payload.get("slotId"))
+            with state.lock:
+                if key in state.booked:
+                    return self._reply(409, {"error": "The slot is no longer available."})
+                state.booked.add(key)
+            self._reply(200, {"status": "booked"})
+
+    return Handler
+
+
+def start_server(port=0, latency=0.0):
+    """Start the stand-in on a background thread; returns (server, state)"""
+    state = SlotsState(latency)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    args = parser.parse_args()
+    server, _ = start_server(args.port, args.latency)
+    print(f"Fake slots API on http://127.0.0.1:{server.server_address[1]}/api/slots")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,316 @@
+"""
+End-to-end load test of the ML webhook against local stand-ins.
+
+    python -m bench.loadtest --configs 1x1,2x4,2x1:gevent --concurrency 16 --duration 30 \\
+        --koha-latency 0.8 --dspace-latency 0.3 --college-latency 1.5 --slots-latency 2.0
+
+For every gunicorn configuration (WORKERSxTHREADS, optionally :WORKER_CLASS)
+the app is started with its upstreams pointed at local fake servers that serve
+the bench/fixtures pages (Koha, DSpace, lnmiit.ac.in) and the fake slots API,
+each with its own added latency. Dialogflow-shaped payloads for each intent
+are then replayed at the given concurrency and throughput, latency
+percentiles and error rates are reported per intent.
+
+Complaint intents need a local Postgres: export DATABASE_HOST/USER/PASSWORD/
+SCHEMA as for the app and pass --init-db to create the complaint table.
+Use --target URL to load an already running server instead of gunicorn.
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import requests
+
+# bench_scrapers turns the refresh scheduler off for this process; the servers under test keep it
+SERVER_ENV = dict(os.environ)
+
+from bench.bench_scrapers import latest_version, load_fixtures  # noqa: E402
+from bench.fake_slots import start_server as start_slots_server  # noqa: E402
+
+ML_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+INTENTS = [
+    "SearchLibraryBooks", "SelectBookFromList", "SearchPapers", "AdmissionData",
+    "Complaint - custom", "complain-Data", "ViewAvailableSlots", "ConfirmSlotBooking",
+]
+BOOK_TITLES = ["introduction to algorithms", "operating system concepts", "digital design",
+               "signals and systems", "linear algebra", "computer networks", "thermodynamics"]
+ADMISSION_CHOICES = ["Important Dates", "Fee Structure", "Programmes Offered", "Eligibility Criteria",
+                     "Contact Information", "Counseling Process"]
+SLOT_RANGES = ["10:00-10:30", "10:30-11:00", "11:00-11:30", "14:00-14:30", "14:30-15:00", "15:00-15:30"]
+SOFT_ERRORS = ("error", "failed", "couldn't", "could not", "unhandled")
+
+COMPLAINT_TABLE = """
+CREATE TABLE IF NOT EXISTS complaint (
+    id SERIAL PRIMARY KEY,
+    complaint TEXT NOT NULL,
+    hostel TEXT NOT NULL,
+    room_no TEXT,
+    date DATE NOT NULL,
+    issue_solved BOOLEAN NOT NULL DEFAULT FALSE,
+    roll_no TEXT,
+    fingerprint TEXT,
+    reporter_count INTEGER NOT NULL DEFAULT 1
+);
+-- as in migrations/004_complaint_fingerprint.sql, needed by the Complaint - custom insert
+CREATE UNIQUE INDEX IF NOT EXISTS complaint_open_fingerprint_idx
+    ON complaint (fingerprint) WHERE NOT issue_solved AND fingerprint IS NOT NULL;
+"""
+
+
+# --- upstream stand-ins -------------------------------------------------------
+
+def start_fixture_server(routes, latency):
+    """Serve fixed bodies by path prefix, after `latency` seconds; returns the base URL"""
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            time.sleep(latency)
+            path = urlsplit(self.path).path
+            body = next((content for prefix, content in routes if path.startswith(prefix)), None)
+            status = 200 if body is not None else 404
+            body = body if body is not None else b"not found"
+            self.send_response(status)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def start_upstreams(args):
+    fixtures = load_fixtures(latest_version())
+    koha = start_fixture_server([
+        ("/cgi-bin/koha/opac-detail.pl", fixtures["koha_record.html"]),
+        ("/cgi-bin/koha/opac-search.pl", fixtures["koha_search.html"]),
+    ], args.koha_latency)
+    dspace = start_fixture_server([("/jspui/handle/", fixtures["dspace_browse.html"])], args.dspace_latency)
+    college = start_fixture_server([
+        ("/events/", fixtures["events.html"]),
+        ("/admissions/ug/regular-mode/", fixtures["admissions.html"]),
+    ], args.college_latency)
+    slots_server, _ = start_slots_server(latency=args.slots_latency)
+    return {
+        "KOHA_BASE_URL": f"{koha}/cgi-bin/koha",
+        "DSPACE_BASE_URL": f"{dspace}/jspui",
+        "LNMIIT_BASE_URL": college,
+        "SLOTS_API_BASE_URL": f"http://127.0.0.1:{slots_server.server_address[1]}/api/slots",
+    }
+
+
+def init_db():
+    sys.path.insert(0, ML_DIR)
+    from config.database import get_db_connection
+
+    conn = get_db_connection()
+    if not conn:
+        sys.exit("Could not connect to the local Postgres (check DATABASE_* variables)")
+    with conn, conn.cursor() as cursor:
+        cursor.execute(COMPLAINT_TABLE)
+    conn.close()
+
+
+# --- payloads ------------------------------------------------------------------
+
+def payload(intent, rng, cold):
+    roll_no = f"22UCS{rng.randint(100, 299)}"
+    session_name = roll_no
+    parameters = {}
+    contexts = []
+
+    def vary(text):
+        return f"{text} {rng.randint(0, 10 ** 6)}" if cold else text
+
+    if intent == "SearchLibraryBooks":
+        parameters = {"book_title": vary(rng.choice(BOOK_TITLES))}
+    elif intent == "SelectBookFromList":
+        records = [{"title": f"Book {i}", "author": "Author", "biblionumber": str(2100 + i * 7)} for i in range(10)]
+        parameters = {"book_choice": str(rng.randint(1, 10)), "biblo_choice": ""}
+        contexts.append(("awaiting_selection", {"search_records": records}))
+    elif intent == "SearchPapers":
+        parameters = {"paper_title": vary(rng.choice(["condensed", "data", "signals", "mid term"]))}
+    elif intent == "AdmissionData":
+        parameters = {"admission_choice": rng.choice(ADMISSION_CHOICES)}
+    elif intent == "Complaint - custom":
+        hostel = f"BH{rng.randint(1, 5)}"
+        parameters = {"complaint_text": [f"fan not working, {hostel}, {rng.randint(100, 450)}, 2026-01-{rng.randint(1, 28):02d}"]}
+    elif intent == "complain-Data":
+        session_name = rng.choice(["BH1", "BH2", "BH3", "BH4", "BH5", "WARDEN"])
+    elif intent == "ViewAvailableSlots":
+        parameters = {"last-name": f"prof{rng.randint(1, 8)}", "date": "2026-01-15T12:00:00+05:30"}
+    elif intent == "ConfirmSlotBooking":
+        parameters = {"slot_range": rng.choice(SLOT_RANGES)}
+        contexts.append(("awaiting_slot_selection", {"faculty_id": f"prof{rng.randint(1, 8)}", "date": "2026-01-15"}))
+
+    session = f"projects/lnmiit-449207/agent/sessions/session_{session_name}_{rng.randint(0, 10 ** 6)}"
+    return {
+        "session": session,
+        "queryResult": {
+            "queryText": intent,
+            "intent": {"displayName": intent},
+            "parameters": parameters,
+            "outputContexts": [
+                {"name": f"{session}/contexts/{name}", "lifespanCount": 1, "parameters": params}
+                for name, params in contexts
+            ],
+        },
+    }
+
+
+# --- load generation -----------------------------------------------------------
+
+def run_load(url, intents, concurrency, duration, cold, seed):
+    samples = defaultdict(list)  # intent -> [(latency, hard_error, soft_error)]
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def worker(n):
+        rng = random.Random(seed + n)
+        session = requests.Session()
+        while time.monotonic() < stop_at:
+            intent = rng.choice(intents)
+            body = payload(intent, rng, cold)
+            start = time.perf_counter()
+            hard = soft = False
+            try:
+                response = session.post(url, json=body, timeout=30)
+                hard = response.status_code != 200
+                if not hard:
+                    text = (response.json().get("fulfillmentText") or "").lower()
+                    soft = any(marker in text for marker in SOFT_ERRORS)
+            except (requests.RequestException, ValueError):
+                hard = True
+            elapsed = time.perf_counter() - start
+            with lock:
+                samples[intent].append((elapsed, hard, soft))
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    return samples
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+
+def summarize(samples, duration):
+    report = {}
+    for intent, rows in sorted(samples.items()):
+        latencies = [r[0] for r in rows]
+        report[intent] = {
+            "requests": len(rows),
+            "rps": round(len(rows) / duration, 2),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+            "error_rate": round(sum(r[1] for r in rows) / len(rows), 4),
+            "soft_error_rate": round(sum(r[2] for r in rows) / len(rows), 4),
+        }
+    total = sum(len(rows) for rows in samples.values())
+    report["_total"] = {"requests": total, "rps": round(total / duration, 2)}
+    return report
+
+
+def print_report(name, report):
+    print(f"\n== {name}: {report['_total']['requests']} requests, {report['_total']['rps']} req/s")
+    print(f"{'intent':22} {'req':>6} {'rps':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'err':>7} {'soft':>7}")
+    for intent, row in report.items():
+        if intent == "_total":
+            continue
+        print(f"{intent:22} {row['requests']:>6} {row['rps']:>7.2f} {row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} "
+              f"{row['p99_ms']:>9.1f} {row['error_rate']:>7.2%} {row['soft_error_rate']:>7.2%}")
+
+
+# --- gunicorn ------------------------------------------------------------------
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_gunicorn(config, env):
+    shape, _, worker_class = config.partition(":")
+    workers, _, threads = shape.partition("x")
+    port = free_port()
+    command = [sys.executable, "-m", "gunicorn", "app:app", "--bind", f"127.0.0.1:{port}",
+               "--workers", workers, "--threads", threads or "1", "--timeout", "60"]
+    # Explicit, so gunicorn.conf.py's gevent default doesn't apply to WORKERSxTHREADS runs
+    command += ["--worker-class", worker_class or "sync"]
+    process = subprocess.Popen(command, cwd=ML_DIR, env=env, stdout=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}/webhook"
+    for _ in range(100):
+        try:
+            requests.get(f"http://127.0.0.1:{port}/webhook/stats", timeout=1)
+            return process, url
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.terminate()
+    sys.exit(f"gunicorn ({config}) did not come up")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--configs", default="1x1,2x4,2x1:gevent", help="comma separated WORKERSxTHREADS[:worker_class]")
+    parser.add_argument("--target", help="webhook URL of an already running server (skips gunicorn and fakes)")
+    parser.add_argument("--intents", default=",".join(INTENTS))
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--cold", action="store_true", help="make search queries unique so caches miss")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--koha-latency", type=float, default=0.5)
+    parser.add_argument("--dspace-latency", type=float, default=0.2)
+    parser.add_argument("--college-latency", type=float, default=1.0)
+    parser.add_argument("--slots-latency", type=float, default=1.0)
+    parser.add_argument("--init-db", action="store_true", help="create the complaint table in the local Postgres")
+    parser.add_argument("--json", help="write all reports to this file")
+    args = parser.parse_args()
+
+    intents = [i.strip() for i in args.intents.split(",") if i.strip()]
+    if args.init_db:
+        init_db()
+
+    reports = {}
+    if args.target:
+        samples = run_load(args.target, intents, args.concurrency, args.duration, args.cold, args.seed)
+        reports[args.target] = summarize(samples, args.duration)
+        print_report(args.target, reports[args.target])
+    else:
+        env = dict(SERVER_ENV, **start_upstreams(args))
+        for config in args.configs.split(","):
+            process, url = start_gunicorn(config, env)
+            try:
+                samples = run_load(url, intents, args.concurrency, args.duration, args.cold, args.seed)
+            finally:
+                process.terminate()
+                process.wait()
+            reports[config] = summarize(samples, args.duration)
+            print_report(f"gunicorn {config}", reports[config])
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,24 @@
 import urllib3
 import os
 import time
+import threading
+from contextlib import contextmanager
 import psycopg2
+import psycopg2.extensions
 from psycopg2.extras import DictCursor  # For dictionary-like results
 from dotenv import load_dotenv
 from psycopg2 import sql
 import logging
+from utils.deadline import capped
+from utils.metrics import collector, histogram
+from utils.log import setup_logging
 
 # Load environment variables from .env file
 load_dotenv()
 
 # Suppress SSL warnings
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-logging.basicConfig(level=logging.INFO)
+setup_logging()
 
 # MySQL database configuration
 db_host = os.getenv("DATABASE_HOST")
@@ -29,20 +35,235 @@ db_config = {
     'port' : 5432
 }
 
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "3"))
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "3"))
+# Connections idle for longer than this are pinged before being handed out
+DB_POOL_CHECK_AFTER = float(os.getenv("DB_POOL_CHECK_AFTER", "30"))
+
+
+DB_CHECKOUT_SECONDS = histogram('ml_db_checkout_wait_seconds', 'Time spent waiting for a pooled Postgres connection')
+DB_HOLD_SECONDS = histogram('ml_db_connection_hold_seconds', 'Time a pooled Postgres connection is borrowed for (queries and commit)')
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection could be checked out within the wait budget"""
+
+
+class ConnectionPool:
+    """
+    Process-wide pool of psycopg2 connections.
+
+    Connections are opened lazily up to `maxsize` and kept open between requests.
+    Checkout waits at most `timeout` seconds for a free connection instead of
+    sleeping and retrying, and connections that sat idle are health-checked first.
+    """
+
+    def __init__(self, minsize=DB_POOL_MIN, maxsize=DB_POOL_MAX, timeout=DB_POOL_TIMEOUT,
+                 check_after=DB_POOL_CHECK_AFTER, **connect_kwargs):
+        self.minsize = minsize
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.check_after = check_after
+        self.connect_kwargs = connect_kwargs
+
+        self._idle = []  # (connection, returned_at)
+        self._size = 0
+        self._cond = threading.Condition()
+
+        self.in_use = 0
+        self.waiting = 0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.connects = 0
+        self.discarded = 0
+        self.checkout_time_total = 0.0
+        self.checkout_time_max = 0.0
+
+    def _connect(self):
+        conn = psycopg2.connect(**self.connect_kwargs)
+        self.connects += 1
+        return conn
+
+    def _healthy(self, conn, returned_at):
+        if conn.closed:
+            return False
+        if time.monotonic() - returned_at < self.check_after:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+        self.discarded += 1
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def prefill(self):
+        while self._size < self.minsize:
+            conn = self._connect()
+            with self._cond:
+                self._size += 1
+                self._idle.append((conn, time.monotonic()))
+
+    def getconn(self, timeout=None):
+        # Don't queue for a connection past the webhook's deadline
+        timeout = capped(self.timeout if timeout is None else timeout)
+        start = time.monotonic()
+        deadline = start + timeout
+
+        while True:
+            conn = None
+            with self._cond:
+                if not self._idle and self._size >= self.maxsize:
+                    self.waiting += 1
+                    try:
+                        while not self._idle and self._size >= self.maxsize:
+                            remaining = deadline - time.monotonic()
+                            if remaining <= 0:
+                                self.timeouts += 1
+                                raise PoolTimeout(f"No database connection available after {timeout:.1f}s")
+                            self._cond.wait(remaining)
+                    finally:
+                        self.waiting -= 1
+
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                else:
+                    self._size += 1
+                    returned_at = None
+
+            if returned_at is None:
+                try:
+                    conn = self._connect()
+                except psycopg2.Error:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._healthy(conn, returned_at):
+                self._discard(conn)
+                continue
+
+            elapsed = time.monotonic() - start
+            DB_CHECKOUT_SECONDS.observe(elapsed)
+            with self._cond:
+                self.in_use += 1
+                self.checkouts += 1
+                self.checkout_time_total += elapsed
+                self.checkout_time_max = max(self.checkout_time_max, elapsed)
+            return conn
+
+    def putconn(self, conn, discard=False):
+        with self._cond:
+            self.in_use -= 1
+        if discard or conn.closed:
+            self._discard(conn)
+            return
+        try:
+            # Never hand out a connection with an open or aborted transaction
+            if conn.status != psycopg2.extensions.STATUS_READY:
+                conn.rollback()
+        except psycopg2.Error:
+            self._discard(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        conn = self.getconn(timeout)
+        discard = False
+        borrowed_at = time.perf_counter()
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            discard = True
+            raise
+        finally:
+            DB_HOLD_SECONDS.observe(time.perf_counter() - borrowed_at)
+            self.putconn(conn, discard=discard)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self.in_use,
+                'waiting': self.waiting,
+                'max_size': self.maxsize,
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'connects': self.connects,
+                'discarded': self.discarded,
+                'checkout_ms_avg': round(self.checkout_time_total / self.checkouts * 1000, 2) if self.checkouts else 0.0,
+                'checkout_ms_max': round(self.checkout_time_max * 1000, 2),
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                pool = ConnectionPool(connect_timeout=DB_CONNECT_TIMEOUT, **db_config)
+                try:
+                    pool.prefill()
+                except psycopg2.Error as err:
+                    logging.warning(f"Could not prefill database pool: {err}")
+                _pool = pool
+    return _pool
+
+
+@collector
+def pool_metrics():
+    if _pool is None:
+        return []
+    stats = _pool.stats()
+    return [
+        (f'ml_db_pool_{key}', 'gauge', f'Postgres pool {key.replace("_", " ")}', [({}, stats[key])])
+        for key in ('size', 'idle', 'in_use', 'waiting', 'max_size')
+    ] + [
+        (f'ml_db_pool_{key}', 'counter', f'Postgres pool {key}', [({}, stats[key])])
+        for key in ('checkouts', 'timeouts', 'connects', 'discarded')
+    ]
+
+
+def db_connection(timeout=None):
+    """
+    Borrow a pooled connection for the duration of a `with` block.
+    Raises PoolTimeout if none is free in time, psycopg2.Error if connecting fails.
+    """
+    return get_pool().connection(timeout)
+
+
 # Database connection function
-def get_db_connection(retries=4, delay=2):
+def get_db_connection(retries=1, delay=0):
+    """Open a dedicated, unpooled connection (for scripts and long-lived listeners)"""
     for attempt in range(retries):
         try:
-            conn = psycopg2.connect(**db_config)
-            print("Database connection successful!")
-            return conn
+            return psycopg2.connect(connect_timeout=DB_CONNECT_TIMEOUT, **db_config)
         except psycopg2.Error as err:
-            print(f"Attempt {attempt + 1} failed: {err}")
+            logging.warning(f"Attempt {attempt + 1} failed: {err}")
             if attempt < retries - 1:
-                time.sleep(delay)  # Wait before retrying
-            else:
-                print("Max retries reached. Failed to connect to the database.")
-                return None
+                time.sleep(delay)
+    logging.error("Failed to connect to the database.")
+    return None
             
 
 
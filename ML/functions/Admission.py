@@ -1,11 +1,21 @@
-from flask import Flask, jsonify
+from flask import Flask
 import requests
-from bs4 import BeautifulSoup
+import hashlib
 import json
+import logging
+import os
+import sys
+import time
 import urllib3
 from urllib3.exceptions import InsecureRequestWarning
 from fuzzywuzzy import fuzz
 from data.getScholarshipdata import get_scholarship_data
+from utils.cache import TTLCache
+from utils.scheduler import scheduler, describe_age
+from utils.log import setup_logging
+from utils.parsing import parses, parse_html, targets_of
+from utils.http import client, HTTP_CONNECT_TIMEOUT
+from utils.dispatch import no_replay
 
 # Disable SSL warnings (not recommended for production)
 urllib3.disable_warnings(InsecureRequestWarning)
@@ -45,6 +55,7 @@ def safe_find_next(parent, element_type=None, **kwargs):
     except:
         return None
     
+@parses(data_ids=('762364c', '164823b', '3b0ea85', '8e58516'), classes=('e-n-tabs-content',))
 def extract_scholarships_assistantship(soup):
     output = ["SCHOLARSHIPS & ASSISTANTSHIPS", "===========================", ""]
     
@@ -105,7 +116,7 @@ def extract_scholarships_assistantship(soup):
                         amount = description.get_text().split("amount is")[-1].split(".")[0].strip()
                         output.append(f"\nAmount: ₹{amount}")
                     else:
-                        output.append(f"Err amount")
+                        output.append("Err amount")
                     
                     output.append("")  # Empty line between scholarships
             else:
@@ -188,6 +199,7 @@ def extract_scholarships_assistantship(soup):
 
     return "\n".join(output)
 
+@parses()  # static data, nothing to parse
 def extract_scholarships_assistantships(soup):
     """Returns raw scholarship data exactly as provided by get_scholarship_data()"""
     return get_scholarship_data()
@@ -216,6 +228,7 @@ def extract_table_data(table):
     
     return data
 
+@parses(names=('h2', 'h3', 'table'))
 def extract_important_dates(soup):
     dates_heading = safe_find(soup, lambda tag: tag.name in ['h2', 'h3'] and 
                               'important dates' in tag.get_text().lower())
@@ -238,6 +251,7 @@ def extract_important_dates(soup):
     #     f.write("\n".join(output))
     return "\n".join(output)
 
+@parses(names=('h2', 'h3', 'ul'), classes=('table-responsive',))
 def extract_programmes_offered(soup):
     programmes_heading = safe_find(soup, lambda tag: tag.name in ['h2', 'h3'] and 
                                    'programmes offered' in tag.get_text().lower())
@@ -247,7 +261,6 @@ def extract_programmes_offered(soup):
     # Find the table-responsive div and extract table data
     programmes_div = safe_find_next(programmes_heading, 'div', class_='table-responsive')
     programmes_table = safe_find(programmes_div, 'table') if programmes_div else None
-    table_data = extract_table_data(programmes_table) if programmes_table else []
     
     # Extract notes section
     notes_heading = safe_find_next(programmes_heading, 'h3', string='Note :')
@@ -283,6 +296,7 @@ def extract_programmes_offered(soup):
     
     return "\n".join(output) if output else "No programme information found"
 
+@parses(data_ids=('6b1558f',))
 def extract_eligibility_criteria(soup):
     eligibility_container = safe_find(soup, 'div', attrs={'data-id': '6b1558f'})
     if not eligibility_container:
@@ -300,6 +314,7 @@ def extract_eligibility_criteria(soup):
 
     return "Eligibility Criteria:\n\n" + "\n".join(f"• {item}" for item in items)
 
+@parses(data_ids=('617fd93',))
 def extract_instructions_to_apply(soup):
     instructions_container = safe_find(soup, 'div', attrs={'data-id': '617fd93'})
     if not instructions_container:
@@ -317,6 +332,7 @@ def extract_instructions_to_apply(soup):
 
     return "Instructions to Apply:\n\n" + "\n".join(f"• {item}" for item in items)
 
+@parses(data_ids=('4c6c62e',))
 def extract_merit_list_preparation(soup):
     merit_container = safe_find(soup, 'div', attrs={'data-id': '4c6c62e'})
     if not merit_container:
@@ -344,6 +360,7 @@ def extract_merit_list_preparation(soup):
 
     return "\n".join(output)
 
+@parses(data_ids=('fc3ec32',))
 def extract_counseling_process(soup):
     counseling_container = safe_find(soup, 'div', attrs={'data-id': 'fc3ec32'})
     if not counseling_container:
@@ -361,6 +378,7 @@ def extract_counseling_process(soup):
 
     return "Counseling Process:\n\n" + "\n".join(f"• {item}" for item in items)
 
+@parses(data_ids=('7445779',))
 def extract_fee_structure(soup):
     # Find the fee structure container using the safe functions
     try:
@@ -490,6 +508,7 @@ def extract_fee_structure(soup):
         return f"Error occurred: {str(e)}"
 
 
+@parses(data_ids=('e7628df',))
 def extract_refund_policy(soup):
     refund_container = safe_find(soup, 'div', attrs={'data-id': 'e7628df'})
     if not refund_container:
@@ -503,6 +522,7 @@ def extract_refund_policy(soup):
 
     return f"Refund Policy:\n\n• {refund_button.get_text(strip=True)}\n• Link: {refund_button['href']}"
 
+@parses(data_ids=('7ca2485',))
 def extract_contact_information(soup):
     contact_container = safe_find(soup, 'div', attrs={'data-id': '7ca2485'})
     if not contact_container:
@@ -555,65 +575,226 @@ def format_admission_sections(admission_data, header=None):
         )
 
 
-def scrape_admission_details(user_title=None):
-    url = "https://lnmiit.ac.in/admissions/ug/regular-mode/"
+ADMISSION_URL = os.getenv("LNMIIT_BASE_URL", "https://lnmiit.ac.in") + "/admissions/ug/regular-mode/"
+client.name_upstream(ADMISSION_URL, 'college')
+# Rendered sections are reused for ADMISSION_CACHE_TTL seconds, then served stale
+# for up to ADMISSION_CACHE_STALE more seconds while a background refresh runs
+ADMISSION_CACHE_TTL = float(os.getenv("ADMISSION_CACHE_TTL", "21600"))
+ADMISSION_CACHE_STALE = float(os.getenv("ADMISSION_CACHE_STALE", "604800"))
+ADMISSION_JOB = "admissions"
+ADMISSION_REFRESH_INTERVAL = float(os.getenv("ADMISSION_REFRESH_INTERVAL", "3600"))
+# Pre-rendered sections written by `python -m functions.Admission`; loaded at boot so
+# AdmissionData never waits on the admissions page. Ignored once older than the max age.
+ADMISSION_SNAPSHOT_PATH = os.getenv(
+    "ADMISSION_SNAPSHOT_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "admissions_snapshot.json"))
+ADMISSION_SNAPSHOT_MAX_AGE = float(os.getenv("ADMISSION_SNAPSHOT_MAX_AGE", "604800"))
+ADMISSION_SNAPSHOT_FORMAT = 1
+
+# Mapping of section titles to their respective extraction functions
+section_functions = {
+    "Important Dates": extract_important_dates,
+    "Programmes Offered": extract_programmes_offered,
+    "Eligibility Criteria": extract_eligibility_criteria,
+    "Instructions to Apply": extract_instructions_to_apply,
+    "Merit List Preparation": extract_merit_list_preparation,
+    "Counseling Process": extract_counseling_process,
+    "Fee Structure": extract_fee_structure,
+    "Refund Policy": extract_refund_policy,
+    "Scholarships & Assistantships": extract_scholarships_assistantships,
+    "Contact Information": extract_contact_information
+}
+
+
+def section_match_keys(titles):
+    """Lower-cased spellings of each title that user input is matched against"""
+    keys = {}
+    for title in titles:
+        keys[title.lower()] = title
+        keys[title.lower().replace('&', 'and')] = title
+    return keys
+
+
+_section_keys = section_match_keys(section_functions)
+_section_targets = targets_of(*section_functions.values())
+
+_sections_cache = TTLCache(maxsize=1, ttl=ADMISSION_CACHE_TTL, stale_ttl=ADMISSION_CACHE_STALE,
+                           name='admission_sections')
+
+
+def render_admission_sections(content):
+    """Run every extraction function over the admissions page and return {title: text}"""
+    # Only the headings, tables and Elementor containers the extractors declare are parsed
+    soup = parse_html(content, _section_targets, name='admissions')
+    admission_data = {}
+    for section_title, extraction_function in section_functions.items():
+        try:
+            admission_data[section_title] = extraction_function(soup)
+        except Exception as e:
+            admission_data[section_title] = f"An error occurred while processing admission information. {str(e)}"
+    return admission_data
+
+
+def fetch_admission_sections():
+    # headers = {
+    #     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+    # }
+    # Conditional GET: when the page is unchanged the previous sections are reused unparsed
+    return client.get_extracted(ADMISSION_URL, extract_admission_sections, verify=False,
+                                timeout=(HTTP_CONNECT_TIMEOUT, 15))
+
+
+def extract_admission_sections(response):
+    response.raise_for_status()
+    return render_admission_sections(response.content)
+
+
+def current_admission_snapshot():
+    """
+    The refresh snapshot (or the one loaded at boot) while it is younger than
+    ADMISSION_SNAPSHOT_MAX_AGE, else None. Checked on every read, so a boot
+    snapshot stops being served once it ages out even if no refresh succeeds.
+    """
+    snapshot = scheduler.snapshot(ADMISSION_JOB)
+    if snapshot is not None and snapshot.age <= ADMISSION_SNAPSHOT_MAX_AGE:
+        return snapshot
+    return None
+
+
+def get_admission_sections():
+    """Rendered admission sections, from a fresh enough snapshot, else the cache or the live page"""
+    snapshot = current_admission_snapshot()
+    if snapshot is not None:
+        return snapshot.value
+    return _sections_cache.get_or_load('sections', fetch_admission_sections)
+
+
+def _sections_checksum(sections):
+    return hashlib.sha256(json.dumps(sections, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def write_admission_snapshot(path=ADMISSION_SNAPSHOT_PATH, content=None):
+    """
+    Render every section (from `content`, or the live page) and write the snapshot
+    file atomically. Refuses to write if any section failed to render.
+    """
+    sections = render_admission_sections(content) if content is not None else fetch_admission_sections()
+    failed = [title for title, text in sections.items()
+              if isinstance(text, str) and text.startswith("An error occurred")]
+    if failed:
+        raise ValueError(f"Sections failed to render: {', '.join(failed)}")
+
+    snapshot = {
+        'format': ADMISSION_SNAPSHOT_FORMAT,
+        'created_at': time.time(),
+        'source': ADMISSION_URL,
+        'checksum': _sections_checksum(sections),
+        'sections': sections,
+        'match_keys': section_match_keys(sections),
+    }
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+    return snapshot
+
+
+def load_admission_snapshot(path=ADMISSION_SNAPSHOT_PATH, max_age=ADMISSION_SNAPSHOT_MAX_AGE):
+    """The snapshot file's contents if it is intact, complete and fresh enough, else None"""
     try:
-        # headers = {
-        #     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        # }
-        response = requests.get(url, verify=False, timeout=15)
-        response.raise_for_status()
-
-        soup = BeautifulSoup(response.content, "html.parser")
-        admission_data = {}
-
-        # Mapping of section titles to their respective extraction functions
-        section_functions = {
-            "Important Dates": extract_important_dates,
-            "Programmes Offered": extract_programmes_offered,
-            "Eligibility Criteria": extract_eligibility_criteria,
-            "Instructions to Apply": extract_instructions_to_apply,
-            "Merit List Preparation": extract_merit_list_preparation,
-            "Counseling Process": extract_counseling_process,
-            "Fee Structure": extract_fee_structure,
-            "Refund Policy": extract_refund_policy,
-            "Scholarships & Assistantships": extract_scholarships_assistantships,
-            "Contact Information": extract_contact_information
-        }
-
-        if user_title:
-            # Use fuzzy matching to find the closest section title
-            best_match = None
-            highest_score = 0
-            threshold = 80  # Adjust this threshold as needed
-
-            for section_title in section_functions.keys():
-                score = fuzz.ratio(user_title.lower(), section_title.lower())
-                if score > highest_score and score >= threshold:
-                    highest_score = score
-                    best_match = section_title
-
-            if best_match:
-                admission_data[best_match] = section_functions[best_match](soup)
-                return format_admission_sections(admission_data, best_match)
-            else:
-                available = list(section_functions.keys())
-                return (
-                    f"No matching section found for '{user_title}'.\n\n" +
-                    "Available sections:\n" +
-                    "\n".join(f"• {section}" for section in available) +
-                    "\n\nPlease try again or type 'exit info' to cancel."
-                )
-        else:
-            # If no title is provided, run all extraction functions
-            for section_title, extraction_function in section_functions.items():
-                admission_data[section_title] = extraction_function(soup)
+        with open(path, encoding='utf-8') as f:
+            snapshot = json.load(f)
+    except FileNotFoundError:
+        logging.info(f"No admissions snapshot at {path}, sections will be scraped live")
+        return None
+    except (OSError, ValueError) as e:
+        logging.warning(f"Unreadable admissions snapshot {path}: {e}")
+        return None
+
+    sections = snapshot.get('sections') or {}
+    if snapshot.get('format') != ADMISSION_SNAPSHOT_FORMAT:
+        problem = f"format {snapshot.get('format')} (expected {ADMISSION_SNAPSHOT_FORMAT})"
+    elif snapshot.get('checksum') != _sections_checksum(sections):
+        problem = "checksum mismatch"
+    elif set(sections) != set(section_functions):
+        problem = "section list differs from this code"
+    elif time.time() - snapshot.get('created_at', 0) > max_age:
+        problem = f"older than {max_age / 86400:g} days"
+    else:
+        return snapshot
+    logging.warning(f"Ignoring admissions snapshot {path}: {problem}")
+    return None
+
+
+def match_admission_section(user_title, threshold=80):
+    """Fuzzy-match a user supplied title against the known section titles"""
+    user_title = user_title.lower()
+    exact = _section_keys.get(user_title)
+    if exact:
+        return exact
+
+    best_match = None
+    highest_score = 0
+    for key, section_title in _section_keys.items():
+        score = fuzz.ratio(user_title, key)
+        if score > highest_score and score >= threshold:
+            highest_score = score
+            best_match = section_title
+    return best_match
 
-        return admission_data
+
+def scrape_admission_details(user_title=None):
+    if user_title:
+        best_match = match_admission_section(user_title)
+        if not best_match:
+            available = list(section_functions.keys())
+            return (
+                f"No matching section found for '{user_title}'.\n\n" +
+                "Available sections:\n" +
+                "\n".join(f"• {section}" for section in available) +
+                "\n\nPlease try again or type 'exit info' to cancel."
+            )
+
+    try:
+        admission_data = get_admission_sections()
     except requests.RequestException as e:
+        no_replay()
         return f"Failed to retrieve admission information. Please try again later. {str(e)}"
     except Exception as e:
+        no_replay()
         return f"An error occurred while processing admission information. {str(e)}"
 
+    if user_title:
+        return (format_admission_sections({best_match: admission_data[best_match]}, best_match) +
+                describe_age(current_admission_snapshot(), 2 * ADMISSION_REFRESH_INTERVAL))
+    return dict(admission_data)
+
 
+# The scholarships section is static (data/getScholarshipdata.py) and is refreshed along with the rest
+scheduler.register(ADMISSION_JOB, fetch_admission_sections, interval=ADMISSION_REFRESH_INTERVAL)
 
+# Serve the snapshot from the first request on; the refresh job replaces it when it next succeeds
+_boot_snapshot = load_admission_snapshot()
+if _boot_snapshot is not None:
+    _section_keys.update({key: title for key, title in _boot_snapshot['match_keys'].items() if title in section_functions})
+    scheduler.seed(ADMISSION_JOB, _boot_snapshot['sections'], fetched_at=_boot_snapshot['created_at'])
+
+
+if __name__ == "__main__":
+    import argparse
+
+    setup_logging()
+    parser = argparse.ArgumentParser(description="Write the admissions snapshot loaded by the webhook at boot")
+    parser.add_argument("--output", default=ADMISSION_SNAPSHOT_PATH)
+    parser.add_argument("--html", help="render from a saved admissions page instead of fetching it")
+    args = parser.parse_args()
+
+    content = None
+    if args.html:
+        with open(args.html, 'rb') as f:
+            content = f.read()
+    try:
+        written = write_admission_snapshot(args.output, content)
+    except (requests.RequestException, ValueError) as e:
+        sys.exit(f"Snapshot not written: {e}")
+    print(f"Wrote {len(written['sections'])} sections to {args.output} (sha256 {written['checksum'][:12]})")
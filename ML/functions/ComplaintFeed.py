@@ -0,0 +1,136 @@
+import json
+import logging
+import os
+import queue
+import select
+import threading
+import time
+
+import psycopg2
+import psycopg2.extensions
+
+from config.database import get_db_connection
+from functions.Complaints import HOSTEL_ROLES
+from utils.metrics import collector
+
+# Channels are complaints_bh1 ... complaints_bh5; see migrations/003_complaint_notify.sql
+FEED_CHANNEL_PREFIX = "complaints_"
+# Complaints buffered per subscriber; a client that falls further behind misses some
+FEED_QUEUE_SIZE = int(os.getenv("COMPLAINT_FEED_QUEUE_SIZE", "100"))
+# Seconds between keep-alive comments on idle streams (proxies drop silent connections)
+FEED_HEARTBEAT = float(os.getenv("COMPLAINT_FEED_HEARTBEAT", "15"))
+FEED_RECONNECT_MAX = float(os.getenv("COMPLAINT_FEED_RECONNECT_MAX", "60"))
+
+
+def feed_channel(hostel):
+    return FEED_CHANNEL_PREFIX + hostel.lower()
+
+
+class ComplaintFeed:
+    """
+    Fans new-complaint notifications out to stream subscribers. Each process
+    holds a single LISTEN connection, opened on the first subscription and
+    reopened with backoff if it drops, however many dashboards are connected.
+    """
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self.connected = False
+        self.failures = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    def subscribe(self, hostels):
+        """A queue receiving the JSON payload of every new complaint in `hostels`"""
+        subscription = queue.Queue(FEED_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers[subscription] = frozenset(hostels)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="complaint-feed", daemon=True)
+                self._thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.pop(subscription, None)
+
+    @property
+    def subscribers(self):
+        return len(self._subscribers)
+
+    def _publish(self, hostel, payload):
+        with self._lock:
+            targets = [q for q, hostels in self._subscribers.items() if hostel in hostels]
+        for subscription in targets:
+            try:
+                subscription.put_nowait(payload)
+                self.delivered += 1
+            except queue.Full:
+                self.dropped += 1
+
+    def _listen(self):
+        conn = get_db_connection()
+        if conn is None:
+            raise psycopg2.OperationalError("Failed to connect to the database.")
+        try:
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with conn.cursor() as cursor:
+                for hostel in HOSTEL_ROLES:
+                    cursor.execute(f"LISTEN {feed_channel(hostel)}")
+            self.connected = True
+            self.failures = 0
+            while True:
+                # poll() also raises once the server has gone away
+                select.select([conn], [], [], FEED_HEARTBEAT)
+                conn.poll()
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    self._publish(notify.channel[len(FEED_CHANNEL_PREFIX):].upper(), notify.payload)
+        finally:
+            self.connected = False
+            conn.close()
+
+    def _run(self):
+        while True:
+            try:
+                self._listen()
+            except Exception as e:
+                self.failures += 1
+                logging.warning(f"Complaint feed listener failed ({self.failures} in a row): {e}")
+            time.sleep(min(FEED_RECONNECT_MAX, 2 ** self.failures))
+
+
+feed = ComplaintFeed()
+
+
+def complaint_events(hostels, heartbeat=FEED_HEARTBEAT):
+    """Server-sent events for new complaints in `hostels`, runs until the client disconnects"""
+    subscription = feed.subscribe(hostels)
+    try:
+        yield "retry: 5000\n\n"
+        while True:
+            try:
+                payload = subscription.get(timeout=heartbeat)
+            except queue.Empty:
+                yield ": keep-alive\n\n"
+                continue
+            complaint_id = json.loads(payload).get('id')
+            yield f"id: {complaint_id}\nevent: complaint\ndata: {payload}\n\n"
+    finally:
+        feed.unsubscribe(subscription)
+
+
+@collector
+def feed_metrics():
+    return [
+        ('ml_complaint_feed_subscribers', 'gauge', 'Open complaint stream connections',
+         [({}, feed.subscribers)]),
+        ('ml_complaint_feed_connected', 'gauge', 'Whether the LISTEN connection is up',
+         [({}, int(feed.connected))]),
+        ('ml_complaint_feed_delivered', 'counter', 'Complaint notifications queued to subscribers',
+         [({}, feed.delivered)]),
+        ('ml_complaint_feed_dropped', 'counter', 'Complaint notifications dropped for slow subscribers',
+         [({}, feed.dropped)]),
+    ]
@@ -0,0 +1,481 @@
+import csv
+import hashlib
+import io
+import os
+import re
+import tempfile
+from datetime import date, timedelta
+
+import psycopg2
+from openpyxl import Workbook
+from psycopg2 import sql
+
+from config.database import db_connection, get_db_connection
+from utils.scheduler import scheduler
+
+COMPLAINT_PAGE_SIZE = int(os.getenv("COMPLAINT_PAGE_SIZE", "10"))
+HOSTEL_ROLES = ("BH1", "BH2", "BH3", "BH4", "BH5")
+# Output context carrying the cursor and filters to the "complain-Data - next" intent
+LISTING_CONTEXT = "complain-data-next"
+
+# Words that don't change which thing is broken ("the fan is not working" == "fan not working")
+ISSUE_STOPWORDS = frozenset(
+    "a an the is are was were be been has have had it its in on at of to for our my me we i "
+    "please pls very there this that room".split()
+)
+
+# Most complaints one bulk update may touch
+BULK_UPDATE_MAX = int(os.getenv("COMPLAINT_BULK_UPDATE_MAX", "500"))
+
+# Rows fetched from the server-side cursor per round trip (and written per CSV chunk)
+EXPORT_CHUNK_ROWS = int(os.getenv("COMPLAINT_EXPORT_CHUNK_ROWS", "2000"))
+EXPORT_HEADER = ('ID', 'Date', 'Hostel', 'Room', 'Complaint', 'Status', 'Filed by', 'Reports')
+
+SUMMARY_DAYS = int(os.getenv("COMPLAINT_SUMMARY_DAYS", "7"))
+SUMMARY_TOP_ISSUES = int(os.getenv("COMPLAINT_SUMMARY_TOP_ISSUES", "5"))
+# The summary tables are kept current by a trigger (migrations/002_complaint_summary.sql,
+# issue counts weighted by reporter_count since 006_complaint_summary_reports.sql);
+# this job only rebuilds the last few days from the complaint rows in case they drifted
+SUMMARY_JOB = "complaint_summary"
+SUMMARY_RECONCILE_INTERVAL = float(os.getenv("COMPLAINT_SUMMARY_RECONCILE_INTERVAL", "3600"))
+SUMMARY_RECONCILE_DAYS = int(os.getenv("COMPLAINT_SUMMARY_RECONCILE_DAYS", "14"))
+# pg_try_advisory_xact_lock key, so only one worker reconciles at a time
+SUMMARY_LOCK_ID = 190_001
+
+STATUS_VALUES = {'open': False, 'pending': False, 'unresolved': False, 'resolved': True, 'solved': True, 'closed': True}
+
+
+def visible_hostel(role, requested=None):
+    """
+    Hostel a role may list complaints for: any (None) or the requested one for
+    the warden, always their own for hostel staff. Raises PermissionError otherwise.
+    """
+    if role == "warden":
+        return requested.upper() if requested else None
+    if role in HOSTEL_ROLES:
+        return role
+    raise PermissionError("You do not have permission to view complaints.")
+
+
+def _iso_date(value):
+    if not value:
+        return None
+    try:
+        # Dialogflow sends sys.date values as full timestamps
+        return date.fromisoformat(str(value)[:10]).isoformat()
+    except ValueError:
+        return None
+
+
+def parse_complaint_filters(parameters):
+    """Listing filters from intent parameters, as plain JSON values that can ride in a context"""
+    period = parameters.get('date-period') or {}
+    status = str(parameters.get('status') or '').strip().lower()
+    return {
+        'hostel': str(parameters.get('hostel') or '').strip().upper() or None,
+        'status': status if status in STATUS_VALUES else None,
+        'date_from': _iso_date(parameters.get('date_from') or period.get('startDate')),
+        'date_to': _iso_date(parameters.get('date_to') or period.get('endDate')),
+        # Turns the listing into a ranked search (complain-Search)
+        'query': str(parameters.get('search_text') or '').strip() or None,
+    }
+
+
+def encode_cursor(row_date, row_id):
+    return f"{row_date.isoformat()}:{row_id}"
+
+
+def decode_cursor(cursor):
+    row_date, _, row_id = cursor.partition(':')
+    return date.fromisoformat(row_date), int(row_id)
+
+
+def _complaint_conditions(hostel=None, status=None, date_from=None, date_to=None):
+    conditions = []
+    args = []
+    if hostel:
+        conditions.append(sql.SQL("hostel = %s"))
+        args.append(hostel)
+    if status:
+        conditions.append(sql.SQL("issue_solved = %s"))
+        args.append(STATUS_VALUES[status])
+    if date_from:
+        conditions.append(sql.SQL("date >= %s"))
+        args.append(date_from)
+    if date_to:
+        conditions.append(sql.SQL("date <= %s"))
+        args.append(date_to)
+    return conditions, args
+
+
+def _where(conditions):
+    return sql.SQL("WHERE ") + sql.SQL(" AND ").join(conditions) if conditions else sql.SQL("")
+
+
+def fetch_complaint_page(hostel=None, status=None, date_from=None, date_to=None, cursor=None,
+                         page_size=COMPLAINT_PAGE_SIZE):
+    """
+    One page of complaints, newest first, after `cursor` (from a previous page).
+    Seeks on (date, id) instead of OFFSET, so every page costs the same however
+    deep it is; see migrations/001_complaint_indexes.sql for the indexes this uses.
+    Returns (rows, next_cursor), next_cursor being None on the last page.
+    """
+    conditions, args = _complaint_conditions(hostel, status, date_from, date_to)
+    if cursor:
+        conditions.append(sql.SQL("(date, id) < (%s, %s)"))
+        args.extend(decode_cursor(cursor))
+
+    query = sql.SQL("""
+        SELECT id, roll_no, complaint, room_no, date, hostel, reporter_count
+        FROM complaint
+        {where}
+        ORDER BY date DESC, id DESC
+        LIMIT %s
+    """).format(where=_where(conditions))
+    # One extra row tells us whether there is a next page
+    args.append(page_size + 1)
+
+    with db_connection() as conn, conn.cursor() as cursor_:
+        cursor_.execute(query, args)
+        rows = cursor_.fetchall()
+
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        return rows, encode_cursor(last[4], last[0])
+    return rows, None
+
+
+def search_complaint_page(query, hostel=None, status=None, date_from=None, date_to=None, cursor=None,
+                          page_size=COMPLAINT_PAGE_SIZE):
+    """
+    One page of complaints matching `query` (web-search syntax: words, "phrases",
+    -exclusions, or), best match first. Matches come from the GIN index in
+    migrations/005_complaint_search.sql. Every page has to rank all matches anyway,
+    so the cursor is a plain offset. Returns (rows, next_cursor) like fetch_complaint_page.
+    """
+    offset = int(cursor or 0)
+    conditions, args = _complaint_conditions(hostel, status, date_from, date_to)
+    # Same expression as the index, or the planner can't use it
+    conditions.append(sql.SQL("to_tsvector('english', complaint) @@ search.query"))
+
+    query_sql = sql.SQL("""
+        SELECT id, roll_no, complaint, room_no, date, hostel, reporter_count
+        FROM complaint, websearch_to_tsquery('english', %s) AS search(query)
+        {where}
+        ORDER BY ts_rank(to_tsvector('english', complaint), search.query) DESC, date DESC, id DESC
+        LIMIT %s OFFSET %s
+    """).format(where=_where(conditions))
+
+    with db_connection() as conn, conn.cursor() as cursor_:
+        cursor_.execute(query_sql, [query] + args + [page_size + 1, offset])
+        rows = cursor_.fetchall()
+
+    if len(rows) > page_size:
+        return rows[:page_size], str(offset + page_size)
+    return rows, None
+
+
+def format_complaint_page(rows, start=1, has_more=False):
+    lines = [
+        f"Complaint {idx} (#{row_id}): {complaint}, Room: {room_no}, Hostel: {hostel}, Date: {row_date}, Filed by: {roll_no}"
+        + (f", Reported {reporters} times" if reporters > 1 else "")
+        for idx, (row_id, roll_no, complaint, room_no, row_date, hostel, reporters) in enumerate(rows, start=start)
+    ]
+    if has_more:
+        lines.append("\nSay 'next' to see more complaints.")
+    return "\n".join(lines)
+
+
+def complaint_fingerprint(hostel, room_no, complaint):
+    """
+    Key shared by reports of the same issue in the same room: case,
+    punctuation, filler words and word order are ignored. None when the text
+    has nothing left to compare on.
+    """
+    words = sorted({w for w in re.findall(r'[a-z0-9]+', complaint.casefold()) if w not in ISSUE_STOPWORDS})
+    if not words:
+        return None
+    room = re.sub(r'[^A-Z0-9]', '', str(room_no).upper())
+    key = f"{hostel.upper()}|{room}|{' '.join(words)}"
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def save_complaint_report(complaint, hostel, room_no, complaint_date, roll_no):
+    """
+    Save a new complaint, or add the report to the still-open complaint with
+    the same fingerprint (migrations/004_complaint_fingerprint.sql) in the same
+    statement. Returns (id, reporter_count); a count above 1 means a repeat.
+    """
+    fingerprint = complaint_fingerprint(hostel, room_no, complaint)
+    with db_connection() as conn, conn.cursor() as cursor:
+        cursor.execute("""
+            INSERT INTO complaint (complaint, hostel, room_no, date, issue_solved, roll_no, fingerprint)
+            VALUES (%s, %s, %s, %s, FALSE, %s, %s)
+            ON CONFLICT (fingerprint) WHERE NOT issue_solved AND fingerprint IS NOT NULL
+            DO UPDATE SET reporter_count = complaint.reporter_count + 1
+            RETURNING id, reporter_count
+        """, (complaint, hostel, room_no, complaint_date, roll_no, fingerprint))
+        complaint_id, reporters = cursor.fetchone()
+        conn.commit()
+    return complaint_id, reporters
+
+
+def parse_complaint_ids(value):
+    """Complaint ids from a number, a list of them, or text like "#12, 15 and 18", deduplicated and sorted"""
+    if isinstance(value, (int, float)):
+        value = [value]
+    if isinstance(value, list):
+        value = " ".join(str(int(v)) if isinstance(v, float) else str(v) for v in value)
+    return sorted({int(match) for match in re.findall(r'\d+', str(value or ''))})
+
+
+def update_complaints(role, ids, solved=None, new_hostel=None):
+    """
+    Mark complaints resolved/open and/or move them to another hostel with one
+    UPDATE ... WHERE id = ANY(...) in a single short transaction. Hostel staff
+    can only change their own hostel's complaints, and only the warden can
+    reassign them. Returns (changed, skipped): how many rows changed, where ids
+    that don't exist, are out of scope or already have the requested values are
+    not counted, and the ids left resolved because the same issue is open again
+    (only one open complaint may hold a fingerprint, see save_complaint_report).
+    """
+    if role != "warden" and role not in HOSTEL_ROLES:
+        raise PermissionError("You do not have permission to update complaints.")
+    scope = visible_hostel(role)
+    if new_hostel is not None and role != "warden":
+        raise PermissionError("Only the warden can reassign complaints to another hostel.")
+    if new_hostel is not None and new_hostel not in HOSTEL_ROLES:
+        raise ValueError(f"Unknown hostel '{new_hostel}'.")
+    if not ids:
+        raise ValueError("Please give the numbers of the complaints to update.")
+    if len(ids) > BULK_UPDATE_MAX:
+        raise ValueError(f"Please update at most {BULK_UPDATE_MAX} complaints at a time.")
+
+    assignments, set_args = [], []
+    changes, change_args = [], []
+    if solved is not None:
+        assignments.append(sql.SQL("issue_solved = %s"))
+        set_args.append(solved)
+        changes.append(sql.SQL("issue_solved IS DISTINCT FROM %s"))
+        change_args.append(solved)
+    if new_hostel is not None:
+        # The fingerprint encodes the old hostel and room, so it would keep catching their reports
+        assignments.append(sql.SQL("fingerprint = CASE WHEN hostel IS DISTINCT FROM %s THEN NULL ELSE fingerprint END"))
+        assignments.append(sql.SQL("hostel = %s"))
+        set_args += [new_hostel, new_hostel]
+        changes.append(sql.SQL("hostel IS DISTINCT FROM %s"))
+        change_args.append(new_hostel)
+    if not assignments:
+        raise ValueError("Please say whether to mark the complaints resolved or open, or which hostel to move them to.")
+
+    conditions = [sql.SQL("id = ANY(%s)"), sql.SQL("(") + sql.SQL(" OR ").join(changes) + sql.SQL(")")]
+    where_args = [list(ids)] + change_args
+    if scope:
+        conditions.append(sql.SQL("hostel = %s"))
+        where_args.append(scope)
+
+    with db_connection() as conn, conn.cursor() as cursor:
+        skipped = _reopen_clashes(cursor, ids, scope, new_hostel) if solved is False else []
+        if skipped:
+            conditions.append(sql.SQL("NOT id = ANY(%s)"))
+            where_args.append(skipped)
+        query = sql.SQL("UPDATE complaint SET {assignments} {where}").format(
+            assignments=sql.SQL(", ").join(assignments), where=_where(conditions))
+        cursor.execute(query, set_args + where_args)
+        updated = cursor.rowcount
+        conn.commit()
+    return updated, skipped
+
+
+def _reopen_clashes(cursor, ids, scope, new_hostel):
+    """
+    Resolved complaints among `ids` that can't be reopened with their fingerprint:
+    the issue is open again in another complaint, or an earlier id in the batch
+    has the same one. Complaints moving to another hostel lose theirs and never clash.
+    """
+    cursor.execute("""
+        WITH batch AS (
+            SELECT id, fingerprint FROM complaint
+            WHERE id = ANY(%s) AND issue_solved AND fingerprint IS NOT NULL
+              AND (%s::text IS NULL OR hostel = %s) AND (%s::text IS NULL OR hostel = %s)
+        )
+        SELECT b.id FROM batch b
+        WHERE EXISTS (SELECT 1 FROM complaint o WHERE o.fingerprint = b.fingerprint AND NOT o.issue_solved)
+           OR EXISTS (SELECT 1 FROM batch e WHERE e.fingerprint = b.fingerprint AND e.id < b.id)
+        ORDER BY b.id
+    """, (list(ids), scope, scope, new_hostel, new_hostel))
+    return [row[0] for row in cursor.fetchall()]
+
+
+def open_complaint_export(hostel=None, status=None, date_from=None, date_to=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    """
+    Lists of complaint rows, oldest first, read through a server-side cursor so
+    only one chunk is ever held in memory. The query runs before this returns,
+    so connection and SQL errors surface here rather than halfway through a
+    response. Uses its own connection: an export can outlast many webhook calls.
+    """
+    conn = get_db_connection()
+    if conn is None:
+        raise psycopg2.OperationalError("Failed to connect to the database.")
+    conditions, args = _complaint_conditions(hostel, status, date_from, date_to)
+    query = sql.SQL("""
+        SELECT id, date, hostel, room_no, complaint, issue_solved, roll_no, reporter_count
+        FROM complaint
+        {where}
+        ORDER BY date, id
+    """).format(where=_where(conditions))
+    try:
+        cursor = conn.cursor(name='complaint_export')
+        cursor.execute(query, args)
+    except psycopg2.Error:
+        conn.close()
+        raise
+
+    def chunks():
+        try:
+            while True:
+                rows = cursor.fetchmany(chunk_rows)
+                if not rows:
+                    return
+                yield rows
+        finally:
+            # Also runs when the client goes away and the response is closed early
+            conn.close()
+
+    return chunks()
+
+
+# Spreadsheet apps run text cells starting with these as formulas
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _export_cell(value):
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _export_row(row):
+    row_id, row_date, hostel, room_no, complaint, solved, roll_no, reporters = row
+    row = row_id, row_date, hostel, room_no, complaint, 'Resolved' if solved else 'Open', roll_no, reporters
+    return tuple(_export_cell(value) for value in row)
+
+
+def export_csv(chunks):
+    """CSV text, one piece per chunk of rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_HEADER)
+    for rows in chunks:
+        writer.writerows(_export_row(row) for row in rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def export_xlsx(chunks, block_size=64 * 1024):
+    """
+    XLSX bytes. openpyxl's write-only mode spools rows to disk as they are
+    appended; the finished zip is then sent from a temporary file in blocks.
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Complaints")
+    sheet.append(EXPORT_HEADER)
+    for rows in chunks:
+        for row in rows:
+            sheet.append(_export_row(row))
+    with tempfile.TemporaryFile() as f:
+        workbook.save(f)
+        f.seek(0)
+        for block in iter(lambda: f.read(block_size), b''):
+            yield block
+
+
+def _hostel_condition(hostel):
+    if hostel:
+        return sql.SQL("AND hostel = %s"), [hostel]
+    return sql.SQL(""), []
+
+
+def fetch_complaint_summary(hostel=None, date_from=None, date_to=None, top=SUMMARY_TOP_ISSUES):
+    """
+    Complaint counts per hostel and status, per day, and the most repeated issues,
+    read from the pre-aggregated tables only: the cost depends on the number of
+    days and hostels asked for, not on how many complaints there are.
+    """
+    date_to = date_to or date.today().isoformat()
+    date_from = date_from or (date.fromisoformat(date_to) - timedelta(days=SUMMARY_DAYS - 1)).isoformat()
+    hostel_filter, hostel_args = _hostel_condition(hostel)
+
+    with db_connection() as conn, conn.cursor() as cursor:
+        cursor.execute(sql.SQL("""
+            SELECT hostel, issue_solved, complaints FROM complaint_status_counts
+            WHERE TRUE {hostel} ORDER BY hostel, issue_solved
+        """).format(hostel=hostel_filter), hostel_args)
+        totals = cursor.fetchall()
+
+        cursor.execute(sql.SQL("""
+            SELECT day,
+                   COALESCE(SUM(complaints) FILTER (WHERE NOT issue_solved), 0),
+                   COALESCE(SUM(complaints) FILTER (WHERE issue_solved), 0)
+            FROM complaint_daily_counts
+            WHERE day BETWEEN %s AND %s {hostel}
+            GROUP BY day HAVING SUM(complaints) > 0 ORDER BY day
+        """).format(hostel=hostel_filter), [date_from, date_to] + hostel_args)
+        days = cursor.fetchall()
+
+        cursor.execute(sql.SQL("""
+            SELECT issue, SUM(complaints) AS repeats FROM complaint_issue_counts
+            WHERE day BETWEEN %s AND %s {hostel}
+            GROUP BY issue HAVING SUM(complaints) > 0
+            ORDER BY repeats DESC, issue LIMIT %s
+        """).format(hostel=hostel_filter), [date_from, date_to] + hostel_args + [top])
+        issues = cursor.fetchall()
+
+    return {'date_from': date_from, 'date_to': date_to, 'totals': totals, 'days': days, 'issues': issues}
+
+
+def format_complaint_summary(summary, hostel=None):
+    lines = [f"Complaint summary for {hostel or 'all hostels'}", "\nAll time:"]
+
+    per_hostel = {}
+    for row_hostel, solved, count in summary['totals']:
+        per_hostel.setdefault(row_hostel, [0, 0])[1 if solved else 0] += count
+    if not per_hostel:
+        return f"No complaints recorded for {hostel or 'any hostel'}."
+    for row_hostel, (open_, resolved) in sorted(per_hostel.items()):
+        lines.append(f"{row_hostel}: {open_} open, {resolved} resolved")
+
+    filed = sum(o + r for _, o, r in summary['days'])
+    still_open = sum(o for _, o, _ in summary['days'])
+    lines.append(f"\nFrom {summary['date_from']} to {summary['date_to']}: {filed} filed ({still_open} still open)")
+    # A line per day reads well for a week or a month, not for a whole year
+    for day, open_, resolved in summary['days'] if len(summary['days']) <= 31 else []:
+        lines.append(f"{day}: {open_ + resolved} ({open_} open)")
+
+    if summary['issues']:
+        lines.append(f"\nMost repeated issues from {summary['date_from']} to {summary['date_to']}:")
+        lines.extend(f"{issue} ({count})" for issue, count in summary['issues'])
+    return "\n".join(lines)
+
+
+def reconcile_complaint_summary(days=SUMMARY_RECONCILE_DAYS):
+    """Rebuild the last `days` of summary rows; skipped when another worker holds the lock"""
+    since = date.today() - timedelta(days=days - 1)
+    with db_connection() as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT pg_try_advisory_xact_lock(%s)", (SUMMARY_LOCK_ID,))
+        if not cursor.fetchone()[0]:
+            conn.rollback()
+            return {'since': since.isoformat(), 'skipped': True}
+        # The rebuild locks the summary tables; complaint inserts queue behind a waiting
+        # lock too, so give up (and retry on the next run) rather than wait on a long transaction
+        cursor.execute("SET LOCAL lock_timeout = '2s'")
+        cursor.execute("SELECT complaint_summary_reconcile(%s)", (since,))
+        rebuilt = cursor.fetchone()[0]
+        conn.commit()
+    return {'since': since.isoformat(), 'rows': rebuilt}
+
+
+scheduler.register(SUMMARY_JOB, reconcile_complaint_summary, interval=SUMMARY_RECONCILE_INTERVAL)
@@ -1,58 +1,90 @@
-from flask import Flask, request, jsonify
-import requests
-from bs4 import BeautifulSoup
+import os
+import logging
+from utils.scheduler import scheduler, describe_age
+from utils.parsing import ParseTargets, parse_html
+from utils.http import client
+from utils.dispatch import no_replay
+
+EVENTS_URL = os.getenv("LNMIIT_BASE_URL", "https://lnmiit.ac.in") + "/events/"
+client.name_upstream(EVENTS_URL, 'college')
+EVENTS_JOB = "events"
+EVENTS_REFRESH_INTERVAL = float(os.getenv("EVENTS_REFRESH_INTERVAL", "900"))
+EVENTS_TARGETS = ParseTargets(classes=('em-view-container',))
+
 
 def scrape_college_website():
-    url = "https://lnmiit.ac.in/events/"
+    """
+    Latest events for the GetLatestAnnouncement intent.
+    Served from the background refresh snapshot; only fetched inline before the first refresh lands.
+    """
+    snapshot = scheduler.snapshot(EVENTS_JOB)
+    if snapshot is not None:
+        return snapshot.value + describe_age(snapshot, 2 * EVENTS_REFRESH_INTERVAL)
+    return fetch_college_events()
+
+
+def fetch_college_events():
+    url = EVENTS_URL
     try:
-        response = requests.get(url, verify=False, timeout=10)
+        # Conditional GET: an unchanged page reuses the last formatted events
+        return client.get_extracted(url, extract_college_events, verify=False)
+    except Exception as e:
+        logging.error(f"Error scraping events: {e}")
+        no_replay()
+        return None
 
-        if response.status_code != 200:
-            print(f"Failed to retrieve data, status code: {response.status_code}")
-            return None
 
-        soup = BeautifulSoup(response.content, "html.parser")
+def extract_college_events(response):
+    if response.status_code != 200:
+        logging.warning(f"Failed to retrieve events page, status code: {response.status_code}")
+        return None
+    return parse_college_events(response.content)
 
-        # Find the div containing the events
-        events_container = soup.find("div", class_="em em-view-container")
 
-        if not events_container:
-            print("Could not find the events container")
-            return None
+def parse_college_events(content):
+    """Format the first five events on the events page, or None if the listing is missing"""
+    soup = parse_html(content, EVENTS_TARGETS, name='events')
 
-        # Find the list of events
-        events_list_container = events_container.find("div", class_="em pixelbones em-list em-events-list")
+    # Find the div containing the events
+    events_container = soup.find("div", class_="em em-view-container")
 
-        if not events_list_container:
-            print("Could not find the events list container")
-            return None
+    if not events_container:
+        logging.warning("Could not find the events container")
+        return None
 
-        events = events_list_container.find_all("div", class_="em-event em-item")
+    # Find the list of events
+    events_list_container = events_container.find("div", class_="em pixelbones em-list em-events-list")
 
-        first_few_events = []
+    if not events_list_container:
+        logging.warning("Could not find the events list container")
+        return None
 
-        for i, event in enumerate(events):
-            if i >= 5:
-                break
+    events = events_list_container.find_all("div", class_="em-event em-item")
 
-            # Get the event title
-            title_tag = event.find("h3", class_="em-item-title")
-            title = title_tag.get_text(strip=True) if title_tag else "No Title"
+    first_few_events = []
 
-            # Get the event date
-            date_tag = event.find("div", class_="em-event-date")
-            date_text = date_tag.get_text(strip=True) if date_tag else "No Date"
+    for i, event in enumerate(events):
+        if i >= 5:
+            break
 
-            # Get the event link
-            link_tag = title_tag.find("a") if title_tag else None
-            link = link_tag['href'] if link_tag else "No Link"
+        # Get the event title
+        title_tag = event.find("h3", class_="em-item-title")
+        title = title_tag.get_text(strip=True) if title_tag else "No Title"
 
-            first_few_events.append(f"{title} - {date_text} - {link}")
+        # Get the event date
+        date_tag = event.find("div", class_="em-event-date")
+        date_text = date_tag.get_text(strip=True) if date_tag else "No Date"
 
-        if first_few_events:
-            return "\n\n".join(first_few_events)
-        else:
-            return "No events found."
-    except Exception as e:
-        print("Error in scraping:", e)
-        return None
\ No newline at end of file
+        # Get the event link
+        link_tag = title_tag.find("a") if title_tag else None
+        link = link_tag['href'] if link_tag else "No Link"
+
+        first_few_events.append(f"{title} - {date_text} - {link}")
+
+    if first_few_events:
+        return "\n\n".join(first_few_events)
+    else:
+        return "No events found."
+
+
+scheduler.register(EVENTS_JOB, fetch_college_events, interval=EVENTS_REFRESH_INTERVAL)
@@ -1,140 +1,227 @@
-from flask import Flask, request, jsonify
-import requests
-from bs4 import BeautifulSoup
-from urllib.parse import quote
+from urllib.parse import quote, quote_plus
+import os
+import logging
+from fuzzywuzzy import fuzz
+from utils.cache import TTLCache
+from utils.parsing import ParseTargets, parse_html
+from utils.http import client
+from utils.dispatch import no_replay
 
+KOHA_BASE_URL = os.getenv("KOHA_BASE_URL", "https://lnmiit-opac.kohacloud.in/cgi-bin/koha")
+client.name_upstream(KOHA_BASE_URL, 'koha')
 
+# Parsed search results are reused across users; availability can change, so keep the TTLs short
+LIBRARY_CACHE_SIZE = int(os.getenv("LIBRARY_CACHE_SIZE", "512"))
+LIBRARY_SEARCH_TTL = float(os.getenv("LIBRARY_SEARCH_TTL", "900"))
+LIBRARY_RECORD_TTL = float(os.getenv("LIBRARY_RECORD_TTL", "300"))
+# How long the list shown to a session stays selectable
+LIBRARY_SELECTION_TTL = float(os.getenv("LIBRARY_SELECTION_TTL", "900"))
 
-def get_book_list(book_title):
+_search_cache = TTLCache(maxsize=LIBRARY_CACHE_SIZE, ttl=LIBRARY_SEARCH_TTL, name='koha_search')
+_record_cache = TTLCache(maxsize=LIBRARY_CACHE_SIZE, ttl=LIBRARY_RECORD_TTL, name='koha_record')
+_selection_cache = TTLCache(maxsize=4096, ttl=LIBRARY_SELECTION_TTL, name='library_selection')
+
+# Record block, holdings table and the search results table; nothing else on the OPAC pages is read
+KOHA_TARGETS = ParseTargets(ids=('holdingst',), classes=('record', 'table-striped'))
+
+NO_RESULTS_TABLE = "No books found matching your search."
+NO_RESULT_ROWS = "The search returned no results."
+
+
+class CatalogError(Exception):
+    """The Koha OPAC answered with a non-200 status"""
+
+
+def normalize_query(book_title):
+    """Cache key for a title search: first list item, case-folded, whitespace collapsed"""
+    title = book_title[0] if isinstance(book_title, list) else book_title
+    return " ".join(title.split()).casefold()
+
+
+def build_search_url(book_title):
+    return f"{KOHA_BASE_URL}/opac-search.pl?idx=&limit=&q={quote_plus(book_title.strip())}&limit=&weight_search=1"
+
+
+def fetch_catalog_page(url, parse):
+    """GET a Koha page and return parse(content); an unchanged page reuses the last parse"""
+    def extract(response):
+        if response.status_code != 200:
+            raise CatalogError(f"Error: Failed to access library catalog (Status {response.status_code})")
+        return parse(response.content)
+    return client.get_extracted(url, extract, verify=False)
+
+
+def parse_search_results(content):
+    """
+    Parse an opac-search page into plain records (no soup is kept).
+    Returns {'kind': 'record', 'record': {...}} when Koha jumped straight to a single
+    book, {'kind': 'list', 'books': [...]} for a result list, or
+    {'kind': 'empty', 'message': ...} when nothing was found.
+    """
+    soup = parse_html(content, KOHA_TARGETS, name='koha_search')
+
+    # First check for single book result
+    single_book = soup.find("div", class_="record")
+    if single_book:
+        return {'kind': 'record', 'record': parse_book_record(soup)}
+
+    # Process multiple books case
+    results_table = soup.find("table", class_="table table-striped")
+    if not results_table:
+        return {'kind': 'empty', 'message': NO_RESULTS_TABLE}
+
+    rows = results_table.find_all("tr") # Skip header row
+    if not rows:
+        return {'kind': 'empty', 'message': NO_RESULT_ROWS}
+
+    books = []
+    for row in rows:
+        title_tag = row.find("a", class_="title")
+        if not title_tag:
+            continue
+            
+        title = title_tag.get_text(strip=True)
+        author_tag = row.find("ul", class_="author")
+        author = author_tag.get_text(strip=True) if author_tag else "Unknown Author"
+
+        # Get biblionumber from the checkbox input
+        biblio_input = row.find("input", class_="cb")
+        biblionumber = biblio_input["value"] if biblio_input else None
+        
+        books.append({
+            'title': title,
+            'author': author,
+            'biblionumber': biblionumber,
+            'row_text': " ".join(row.get_text(" ", strip=True).split())[:300],
+        })
+
+    if not books:
+        return {'kind': 'empty', 'message': "No matching books found."}
+    return {'kind': 'list', 'books': books}
+
+
+def search_catalog(book_title):
+    """Parsed opac-search results for a title, cached by normalized query"""
+    url = build_search_url(book_title[0] if isinstance(book_title, list) else book_title)
+    return _search_cache.get_or_load(
+        normalize_query(book_title),
+        lambda: fetch_catalog_page(url, parse_search_results)
+    )
+
+
+def get_book_list(book_title, session_id=None):
     """
     For PARENT INTENT - Searches for multiple books and returns a formatted list
     Returns either:
     - Direct details if single book found (by calling get_single_book_details)
     - List of matching books if multiple found
     - Error message if none found
+    When a list is shown, it is remembered for `session_id` so the follow-up pick resolves locally.
     """
-        # First clean the title
-    cleaned_title = book_title[0].strip() if isinstance(book_title, list) else book_title.strip()
+    try:
+        result = search_catalog(book_title)
+    except CatalogError as e:
+        no_replay()
+        return str(e)
+    except Exception as e:
+        logging.error(f"Search error: {e}")
+        no_replay()
+        return "Error searching the library catalog"
 
-    
-    # Replace specific punctuation that might affect searches
-    replacements = {
-        ',': '%2C',
-        "'": '%27',
-        '"': '%22',
-        '!': '%21',
-        '?': '%3F',
-        ':': '%3A',
-        ';': '%3B',
-        '(': '%28',
-        ')': '%29',
-        '&': '%26'
-    }
-    
-    # Apply replacements
-    for char, code in replacements.items():
-        cleaned_title = cleaned_title.replace(char, code)
-    
-    # Replace spaces with +
-    book_title_query = cleaned_title.replace(' ', '+')
-    search_url = f"https://lnmiit-opac.kohacloud.in/cgi-bin/koha/opac-search.pl?idx=&limit=&q={book_title_query}&limit=&weight_search=1"
+    if result['kind'] == 'record':
+        return format_book_info(result['record'])  # Delegate to single book formatter
+    if result['kind'] == 'empty':
+        return result['message']
 
-    try:
-        response = requests.get(search_url, verify=False, timeout=10)
-        if response.status_code != 200:
-            return f"Error: Failed to access library catalog (Status {response.status_code})"
-
-        soup = BeautifulSoup(response.content, "html.parser")
-
-        # First check for single book result
-        single_book = soup.find("div", class_="record")
-        if single_book:
-            return get_book_info(soup)  # Delegate to single book handler
-
-        # Process multiple books case
-        results_table = soup.find("table", class_="table table-striped")
-        if not results_table:
-            return "No books found matching your search."
-
-        rows = results_table.find_all("tr") # Skip header row
-        if not rows:
-            return "The search returned no results."
-
-        books = []
-        for row in rows:
-            title_tag = row.find("a", class_="title")
-            if not title_tag:
-                continue
-                
-            title = title_tag.get_text(strip=True)
-            author_tag = row.find("ul", class_="author")
-            author = author_tag.get_text(strip=True) if author_tag else "Unknown Author"
-
-            # Get biblionumber from the checkbox input
-            biblio_input = row.find("input", class_="cb")
-            biblionumber = biblio_input["value"] if biblio_input else None
-            
-            books.append({
-                'title': title,
-                'author': author,
-                'biblionumber': biblionumber, 
-                'full_row': row  # Pass entire row for detailed processing if needed
-            })
+    books = result['books']
+    query = normalize_query(book_title)
+    partial_matches = [b for b in books if query in b['title'].casefold()]
+    shown = partial_matches or books
+    if session_id:
+        _selection_cache.set(session_id, shown)
+    if partial_matches:
+        return format_book_list(partial_matches, "Partial matches found")
+        
+    return format_book_list(books, "All books in search results")
 
-        if not books:
-            return "No matching books found."
 
-            
-        partial_matches = [b for b in books if book_title.lower() in b['title'].lower()]
-        if partial_matches:
-            return format_book_list(partial_matches, "Partial matches found")
-            
-        return format_book_list(books, "All books in search results")
+def get_shown_books(session_id):
+    """The book list last shown to this session, or None"""
+    return _selection_cache.get(session_id)
+
+
+def resolve_book_choice(books, book_choice='', biblo_choice=''):
+    """
+    Pick one book out of a shown list by biblionumber, list position ("2") or title.
+    Titles are matched exactly first, then fuzzily. Returns None if nothing fits.
+    """
+    if not books:
+        return None
+    book_choice = (book_choice or '').strip()
+    biblo_choice = str(biblo_choice or '').strip()
+
+    if biblo_choice:
+        for book in books:
+            if str(book.get('biblionumber')) == biblo_choice:
+                return book
+    if book_choice.isdigit():
+        for book in books:
+            if str(book.get('biblionumber')) == book_choice:
+                return book
+        index = int(book_choice)
+        if 1 <= index <= len(books):
+            return books[index - 1]
+    if not book_choice:
+        return None
+
+    choice = normalize_query(book_choice)
+    for book in books:
+        if normalize_query(book['title']) == choice:
+            return book
+
+    best_match = None
+    highest_score = 0
+    for book in books:
+        score = fuzz.token_set_ratio(choice, book['title'].casefold())
+        if score > highest_score and score >= 80:
+            highest_score = score
+            best_match = book
+    return best_match
 
-    except Exception as e:
-        print(f"Search error: {e}")
-        return "Error searching the library catalog"
+
+def get_selected_book_details(session_id, book_choice, biblo_choice='', shown_books=None):
+    """
+    For FOLLOW-UP INTENT - resolve the pick against the list shown by get_book_list()
+    and fetch only that record's detail page. Falls back to a fresh search when the
+    list has expired or the pick doesn't match anything in it.
+    """
+    books = get_shown_books(session_id) if session_id else None
+    book = resolve_book_choice(books or shown_books, book_choice, biblo_choice)
+    if book and book.get('biblionumber'):
+        return get_single_book_bibilo(book['title'], book['biblionumber'])
+
+    if biblo_choice:
+        return get_single_book_bibilo(book_choice, biblo_choice)
+    return get_single_book_details(book_choice)
 
 def get_single_book_details(book_title):
     """
     For FOLLOW-UP INTENT - Extracts detailed information about a specific book
     Returns formatted string with complete book details
     """
-    # First clean the title
-    cleaned_title = book_title.strip()
-    
-    # Replace specific punctuation that might affect searches
-    replacements = {
-        ',': '%2C',
-        "'": '%27',
-        '"': '%22',
-        '!': '%21',
-        '?': '%3F',
-        ':': '%3A',
-        ';': '%3B',
-        '(': '%28',
-        ')': '%29',
-        '&': '%26'
-    }
-    
-    # Apply replacements
-    for char, code in replacements.items():
-        cleaned_title = cleaned_title.replace(char, code)
-    
-    # Replace spaces with +
-    book_title_query = cleaned_title.replace(' ', '+')
-    search_url = f"https://lnmiit-opac.kohacloud.in/cgi-bin/koha/opac-search.pl?idx=&limit=&q={book_title_query}&limit=&weight_search=1"
-
     try:
-        response = requests.get(search_url, verify=False, timeout=10)
-        if response.status_code != 200:
-            return f"Error: Failed to access library catalog (Status {response.status_code})"
-        soup = BeautifulSoup(response.content, "html.parser")
-        return get_book_info(soup)
-
+        result = search_catalog(book_title)
+    except CatalogError as e:
+        no_replay()
+        return str(e)
     except Exception as e:
-        print(f"Detail extraction error: {e}")
+        logging.error(f"Detail extraction error: {e}")
+        no_replay()
         return "Could not retrieve complete book details"
+
+    if result['kind'] != 'record':
+        return "Book details not available"
+    return format_book_info(result['record'])
     
 def get_single_book_bibilo(book_title, biblo_num):
     """
@@ -143,20 +230,88 @@ def get_single_book_bibilo(book_title, biblo_num):
     """
     encoded_title = quote(book_title)
    # Construct the URL
-    search_url = f"https://lnmiit-opac.kohacloud.in/cgi-bin/koha/opac-detail.pl?biblionumber={biblo_num}&query_desc=kw%2Cwrdl%3A{encoded_title}"
+    search_url = f"{KOHA_BASE_URL}/opac-detail.pl?biblionumber={biblo_num}&query_desc=kw%2Cwrdl%3A{encoded_title}"
 
     try:
-        response = requests.get(search_url, verify=False, timeout=10)
-        if response.status_code != 200:
-            return f"Error: Failed to access library catalog (Status {response.status_code})"
-
-        soup = BeautifulSoup(response.content, "html.parser")
-        return get_book_info(soup)
-
+        record = _record_cache.get_or_load(
+            str(biblo_num).strip(),
+            lambda: fetch_catalog_page(search_url, parse_record_page)
+        )
+    except CatalogError as e:
+        no_replay()
+        return str(e)
     except Exception as e:
-        print(f"Detail extraction error: {e}")
+        logging.error(f"Detail extraction error: {e}")
+        no_replay()
         return "Could not retrieve complete book details"
+    return format_book_info(record)
+    
+
+def parse_record_page(content):
+    """Parse an opac-detail page into a record dict (or None)"""
+    return parse_book_record(parse_html(content, KOHA_TARGETS, name='koha_record'))
+
+
+def parse_book_record(soup):
+    """
+    Extracts book details from a BeautifulSoup object of a Koha record page.
+
+    Returns:
+        dict: title, author, isbn, ddc and availability, or None if the page has no record
+    """
+    record = soup.find("div", class_="record")
+    if not record:
+        return None
+
+    # Extract basic information
+    title = record.find("h1", class_="title").text.strip() if record.find("h1", class_="title") else "Unknown Title"
+    author_tag = record.find("span", property="name")
+    author = author_tag.text.strip() if author_tag else "Unknown Author"
     
+    # Extract ISBN
+    isbn_tag = record.find("span", property="isbn")
+    isbn = isbn_tag.text.strip() if isbn_tag else "Unknown ISBN"
+    
+    # Extract DDC classification
+    ddc_tag = record.find("span", class_="results_summary ddc")
+    ddc = ddc_tag.find("li").text.strip() if ddc_tag and ddc_tag.find("li") else "Unknown DDC"
+
+    # Extract availability information
+    availability = None
+    holdings_table = soup.find("table", id="holdingst")
+    if holdings_table:
+        availability = "Not Available"
+        for row in holdings_table.find_all("tr")[1:]:
+            cols = row.find_all("td")
+            if len(cols) >= 5 and "Available" in cols[4].text.strip():
+                availability = "Available"
+                break
+
+    return {
+        'title': title,
+        'author': author,
+        'isbn': isbn,
+        'ddc': ddc,
+        'availability': availability,
+    }
+
+
+def format_book_info(book):
+    """Format a record from parse_book_record() for the chat reply"""
+    if not book:
+        return "Book details not available"
+    if not book['availability']:
+        return "Could not retrieve complete book details"
+
+    details = [
+        f"Title: {book['title']}",
+        f"Author: {book['author']}",
+        f"ISBN: {book['isbn']}",
+        f"Call Number: {book['ddc']}",
+        f"Availability: {book['availability']}"
+    ]
+    return "\n".join(details)
+
 
 def get_book_info(soup):
     """
@@ -168,61 +323,10 @@ def get_book_info(soup):
     Returns:
         str: Formatted string containing book details or error message
     """
-    record = soup.find("div", class_="record")
-    if not record:
-        return "Book details not available"
-
     try:
-        # Extract basic information
-        title = record.find("h1", class_="title").text.strip() if record.find("h1", class_="title") else "Unknown Title"
-        author_tag = record.find("span", property="name")
-        author = author_tag.text.strip() if author_tag else "Unknown Author"
-        
-        # Extract ISBN
-        isbn_tag = record.find("span", property="isbn")
-        isbn = isbn_tag.text.strip() if isbn_tag else "Unknown ISBN"
-        
-        # Extract publication details (not present in sample, keeping as fallback)
-        publication = "Unknown Publication"
-        
-        # Extract DDC classification
-        ddc_tag = record.find("span", class_="results_summary ddc")
-        ddc = ddc_tag.find("li").text.strip() if ddc_tag and ddc_tag.find("li") else "Unknown DDC"
-
-  
-        
-        # Extract availability information
-        # Extract availability information
-        availability = []
-        holdings_table = soup.find("table", id="holdingst")
-        if holdings_table:
-            for row in holdings_table.find_all("tr")[1:]:
-                cols = row.find_all("td")
-                if len(cols) >= 5:
-                    status = cols[4].text.strip()
-                    if "Available" in status:
-                        availability.append("Available")
-                        break
-            else:
-                availability.append("Not Available")
-        
-                # Extract holds information
-        holds_tag = soup.find("div", id="bib_holds")
-        holds = holds_tag.text.strip() if holds_tag else "No holds information"
-        
-        # Format the complete response
-        details = [
-            f"Title: {title}",
-            f"Author: {author}",
-            f"ISBN: {isbn}",
-            f"Call Number: {ddc}",
-            f"Availability: {availability[0]}"
-        ]
-        
-        return "\n".join(details)
-        
+        return format_book_info(parse_book_record(soup))
     except Exception as e:
-        print(f"Error extracting details: {str(e)}")
+        logging.error(f"Error extracting details: {e}")
         return "Could not retrieve complete book details"
 
 def format_book_list(books, header):
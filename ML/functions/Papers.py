@@ -1,27 +1,34 @@
-from flask import Flask, request, jsonify
-import requests
-from bs4 import BeautifulSoup
 from urllib.parse import urljoin
+from utils.parsing import ParseTargets, parse_html
+from utils.http import client
+from utils.dispatch import no_replay
+from utils.log import capture, setup_logging
 import logging
+import os
 import urllib3
 
-BASE_URL = "http://172.22.2.20:8080/jspui"
-SESSION = requests.Session()
+BASE_URL = os.getenv("DSPACE_BASE_URL", "http://172.22.2.20:8080/jspui")
+client.name_upstream(BASE_URL, 'dspace')
+# The browse listing is the only thing read off the DSpace page
+PAPERS_TARGETS = ParseTargets(names=('table',))
 
 # Suppress SSL warnings
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-logging.basicConfig(level=logging.INFO)
+setup_logging()
 
-def get_with_retry(url, max_retries=3):
-    for attempt in range(max_retries):
-        try:
-            response = SESSION.get(url, timeout=10, verify=False)
-            response.raise_for_status()
-            return response
-        except requests.exceptions.RequestException as e:
-            logging.warning(f"Attempt {attempt + 1} failed: {str(e)}")
-            if attempt == max_retries - 1:
-                raise
+def get_with_retry(url, max_retries=3, **kwargs):
+    # Retries with backoff happen inside the shared client
+    response = client.get(url, verify=False, retries=max_retries - 1, **kwargs)
+    response.raise_for_status()
+    return response
+
+
+def extract_papers(response):
+    response.raise_for_status()
+    logging.debug(f"Response status: {response.status_code}")
+    # Opt-in: DEBUG_CAPTURE_RATE saves a sample of pages to examine
+    capture('dspace_browse', response.text)
+    return parse_papers(response.text)
 
 def handle_search_papers_intent(req):
     """
@@ -29,25 +36,25 @@ def handle_search_papers_intent(req):
     Args:
         req: The Dialogflow webhook request
     Returns:
-        Flask jsonify response with fulfillment messages
+        Response dict with fulfillment messages
     """
     # Extract parameters
     paper_title = req.get('queryResult', {}).get('parameters', {}).get('paper_title', '')
     
     # Validate input
     if not paper_title:
-        return jsonify({'fulfillmentText': "Please provide a paper title to search for."})
+        return {'fulfillmentText': "Please provide a paper title to search for."}
     
-    print(f"Searching for paper: {paper_title}")
+    logging.info(f"Searching for paper: {paper_title}", extra={'route': 'SearchPapers'})
     
     # Get papers data
     papers = scrape_papers(paper_title)
     
     # Format response
     if not papers:
-        return jsonify({
+        return {
             'fulfillmentText': f"No papers found matching '{paper_title}'."
-        })
+        }
     
     return format_papers_response(papers, paper_title)
 
@@ -58,7 +65,7 @@ def format_papers_response(papers, paper_title):
         papers: List of paper dictionaries
         paper_title: Original search query
     Returns:
-        Formatted jsonify response
+        Formatted response dict
     """
     # Create basic text response
     text_response = f"I found {len(papers)} papers about {paper_title}:\n"
@@ -100,11 +107,11 @@ def format_papers_response(papers, paper_title):
         
         fulfillment_messages.append(card)
     
-    return jsonify({
+    return {
         'fulfillmentText': text_response,
         'fulfillmentMessages': fulfillment_messages,
         'source': 'jspui-library-webhook'
-    })
+    }
 
     
 
@@ -120,48 +127,42 @@ def scrape_papers(paper_title):
             'starts_with': paper_title.replace(' ', '+')
         }
         
-        # Try both with and without session
-        try:
-            response = get_with_retry(search_url, params=params)
-        except:
-            response = requests.get(search_url, params=params, verify=False, timeout=10)
-        
-        response.raise_for_status()
-        logging.info(f"Response status: {response.status_code}")
-        
-        # Debug: Save the response content to examine
-        with open('debug_response.html', 'w', encoding='utf-8') as f:
-            f.write(response.text)
-        
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # Alternative parsing if default fails
-        results_table = soup.find("table", summary="This table browses all dspace content") or \
-                       soup.find("table", class_="table") or \
-                       soup.find("table")
-        
-        if not results_table:
-            logging.error("No results table found in the page")
-            return None
-            
-        papers = []
-        for row in results_table.find_all("tr")[1:]:  # Skip header
-            cols = row.find_all("td")
-            if len(cols) >= 3:
-                try:
-                    paper = {
-                        'date': cols[0].get_text(strip=True),
-                        'title': cols[1].get_text(strip=True),
-                        'authors': cols[2].get_text(strip=True),
-                        'url': urljoin(BASE_URL, cols[1].find("a")["href"])
-                    }
-                    papers.append(paper)
-                except Exception as e:
-                    logging.error(f"Error parsing row: {str(e)}")
-                    continue
-        
-        return papers
+        # Conditional GET: a browse page seen before is not parsed again
+        return client.get_extracted(search_url, extract_papers, params=params, verify=False, retries=2)
 
     except Exception as e:
         logging.error(f"Scraping error: {str(e)}")
+        no_replay()
+        return None
+
+
+def parse_papers(html):
+    """Extract paper dicts from a DSpace browse page, or None if it has no results table"""
+    soup = parse_html(html, PAPERS_TARGETS, name='dspace_browse')
+    
+    # Alternative parsing if default fails
+    results_table = soup.find("table", summary="This table browses all dspace content") or \
+                   soup.find("table", class_="table") or \
+                   soup.find("table")
+    
+    if not results_table:
+        logging.error("No results table found in the page")
         return None
+        
+    papers = []
+    for row in results_table.find_all("tr")[1:]:  # Skip header
+        cols = row.find_all("td")
+        if len(cols) >= 3:
+            try:
+                paper = {
+                    'date': cols[0].get_text(strip=True),
+                    'title': cols[1].get_text(strip=True),
+                    'authors': cols[2].get_text(strip=True),
+                    'url': urljoin(BASE_URL, cols[1].find("a")["href"])
+                }
+                papers.append(paper)
+            except Exception as e:
+                logging.error(f"Error parsing row: {str(e)}")
+                continue
+    
+    return papers
@@ -0,0 +1,77 @@
+import logging
+import os
+import requests
+from utils.cache import TTLCache
+from utils.http import client
+from utils.dispatch import no_replay
+
+SLOTS_API_BASE_URL = os.getenv("SLOTS_API_BASE_URL", 'https://facultyslots.onrender.com/api/slots')
+client.name_upstream(SLOTS_API_BASE_URL, 'slots')
+
+# Availability is re-asked a lot while students decide; bookings invalidate their entry
+SLOTS_CACHE_TTL = float(os.getenv("SLOTS_CACHE_TTL", "30"))
+_availability_cache = TTLCache(maxsize=1024, ttl=SLOTS_CACHE_TTL, name='slots_availability')
+
+
+def fetch_available_slots(faculty_id, date):
+    """Raw slot list for (faculty_id, date), cached for SLOTS_CACHE_TTL seconds"""
+    def load():
+        response = client.get(SLOTS_API_BASE_URL, params={'facultyId': faculty_id, 'date': date})
+        response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
+        return response.json() or []
+
+    return _availability_cache.get_or_load((str(faculty_id), date), load)
+
+
+def invalidate_available_slots(faculty_id, date):
+    _availability_cache.invalidate((str(faculty_id), date))
+
+
+def get_available_slots_from_api(faculty_id, date):
+    """Calls Spring Boot GET endpoint to fetch available slots."""
+    try:
+        slots = fetch_available_slots(faculty_id, date)
+        
+        if not slots:
+            return "I found no available slots for that date."
+            
+        # Format slots for the user
+        response_text = "Here are the available slots:\n"
+        for idx, slot in enumerate(slots, 1):
+            response_text += f"{idx}. {slot.get('start')} - {slot.get('end')}\n"
+            
+        return response_text
+        
+    except requests.exceptions.RequestException as e:
+        logging.error(f"API error fetching slots: {e}")
+        no_replay()
+        return "I'm sorry, I couldn't connect to the booking system right now."
+
+
+def book_slot_via_api(payload):
+    """Calls Spring Boot POST endpoint to book a slot."""
+    try:
+        url = f"{SLOTS_API_BASE_URL}/book"
+        
+        response = client.post(url, json=payload)
+        
+        if response.status_code in (200, 409):
+            # Either way the cached availability for that day is now wrong
+            invalidate_available_slots(payload.get('facultyId'), payload.get('date'))
+
+        if response.status_code == 200:
+            return "Your slot has been successfully booked!"
+        
+        elif response.status_code == 409:
+            # Conflict status from Spring Boot (e.g., slot already booked)
+            error_data = response.json()
+            return f"Booking failed: {error_data.get('error', 'The slot is no longer available.')}"
+            
+        else:
+            # General API error
+            error_data = response.json()
+            return f"An error occurred while confirming the booking. Code {response.status_code}. {error_data.get('error', '')}"
+
+    except requests.exceptions.RequestException as e:
+        logging.error(f"API error booking slot: {e}")
+        return "I'm sorry, there was a system error when trying to book."
@@ -0,0 +1,30 @@
+"""
+Gunicorn settings for the ML webhook (picked up automatically from this directory).
+
+Every intent spends nearly all of its time waiting on Koha, DSpace, lnmiit.ac.in,
+the slots API or Postgres, so the default worker class is gevent: each worker
+process serves up to GUNICORN_WORKER_CONNECTIONS webhook calls concurrently and
+a slow upstream only parks the greenlets waiting on it. gevent patches sockets,
+threading and time before the app is imported, which covers requests, the
+refresh scheduler and the caches; psycopg2 is made cooperative below.
+
+Set GUNICORN_WORKER_CLASS=sync (or gthread with GUNICORN_THREADS) to go back to
+thread-per-request serving.
+"""
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gevent")
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+threads = int(os.getenv("GUNICORN_THREADS", "1"))
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "500"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+keepalive = 5
+
+
+def post_worker_init(worker):
+    # psycopg2 talks to Postgres through libpq, which gevent can't patch; route its
+    # waits through the gevent hub so a slow query doesn't block the whole worker
+    if "gevent" in worker.cfg.worker_class_str:
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
@@ -0,0 +1,27 @@
+-- Indexes for keyset-paginated complaint listing (functions/Complaints.py).
+--
+-- Every listing is ORDER BY date DESC, id DESC and seeks past the previous page
+-- with (date, id) < (cursor), so each filter combination gets an index that
+-- ends in (date, id): the page is then read straight off the index whatever
+-- the table size.
+--
+-- CONCURRENTLY keeps inserts flowing while the indexes build, but cannot run
+-- inside a transaction block:
+--     psql "$DATABASE_URL" -f migrations/001_complaint_indexes.sql
+
+-- Hostel staff / warden filtering by hostel and resolved status
+CREATE INDEX CONCURRENTLY IF NOT EXISTS complaint_hostel_solved_date_idx
+    ON complaint (hostel, issue_solved, date, id);
+
+-- Hostel staff without a status filter
+CREATE INDEX CONCURRENTLY IF NOT EXISTS complaint_hostel_date_idx
+    ON complaint (hostel, date, id);
+
+-- Warden across all hostels, with and without a status filter
+CREATE INDEX CONCURRENTLY IF NOT EXISTS complaint_solved_date_idx
+    ON complaint (issue_solved, date, id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS complaint_date_idx
+    ON complaint (date, id);
+
+ANALYZE complaint;
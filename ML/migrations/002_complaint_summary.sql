@@ -0,0 +1,118 @@
+-- Pre-aggregated complaint counts for the complain-Summary intent
+-- (functions/Complaints.py). A trigger keeps them in step with every insert,
+-- update and delete on complaint, so summaries read a handful of small rows
+-- instead of the complaint table. complaint_summary_reconcile() rebuilds
+-- recent days from the source rows and runs periodically from the webhook's
+-- refresh scheduler, which repairs drift from bulk loads done with triggers off.
+--
+--     psql "$DATABASE_URL" -v ON_ERROR_STOP=1 -f migrations/002_complaint_summary.sql
+
+BEGIN;
+
+-- Complaints per hostel, day and status
+CREATE TABLE IF NOT EXISTS complaint_daily_counts (
+    hostel TEXT NOT NULL,
+    day DATE NOT NULL,
+    issue_solved BOOLEAN NOT NULL,
+    complaints INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (hostel, day, issue_solved)
+);
+CREATE INDEX IF NOT EXISTS complaint_daily_counts_day_idx ON complaint_daily_counts (day);
+
+-- Repeated issues per hostel and day, keyed by normalized complaint text
+CREATE TABLE IF NOT EXISTS complaint_issue_counts (
+    hostel TEXT NOT NULL,
+    day DATE NOT NULL,
+    issue TEXT NOT NULL,
+    complaints INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (hostel, day, issue)
+);
+CREATE INDEX IF NOT EXISTS complaint_issue_counts_day_idx ON complaint_issue_counts (day);
+
+-- All-time totals per hostel and status (a few rows)
+CREATE TABLE IF NOT EXISTS complaint_status_counts (
+    hostel TEXT NOT NULL,
+    issue_solved BOOLEAN NOT NULL,
+    complaints INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (hostel, issue_solved)
+);
+
+CREATE OR REPLACE FUNCTION complaint_issue_key(complaint TEXT) RETURNS TEXT
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT left(lower(regexp_replace(btrim(coalesce(complaint, '')), '\s+', ' ', 'g')), 120)
+$$;
+
+CREATE OR REPLACE FUNCTION complaint_summary_add(
+    p_hostel TEXT, p_day DATE, p_solved BOOLEAN, p_complaint TEXT, p_delta INTEGER
+) RETURNS VOID LANGUAGE sql AS $$
+    INSERT INTO complaint_daily_counts AS c (hostel, day, issue_solved, complaints)
+    VALUES (p_hostel, p_day, p_solved, p_delta)
+    ON CONFLICT (hostel, day, issue_solved) DO UPDATE SET complaints = c.complaints + EXCLUDED.complaints;
+
+    INSERT INTO complaint_issue_counts AS c (hostel, day, issue, complaints)
+    VALUES (p_hostel, p_day, complaint_issue_key(p_complaint), p_delta)
+    ON CONFLICT (hostel, day, issue) DO UPDATE SET complaints = c.complaints + EXCLUDED.complaints;
+
+    INSERT INTO complaint_status_counts AS c (hostel, issue_solved, complaints)
+    VALUES (p_hostel, p_solved, p_delta)
+    ON CONFLICT (hostel, issue_solved) DO UPDATE SET complaints = c.complaints + EXCLUDED.complaints;
+$$;
+
+CREATE OR REPLACE FUNCTION complaint_summary_trigger() RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+    -- Rows without a hostel or date can't be bucketed; the reconcile skips them too
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.hostel IS NOT NULL AND OLD.date IS NOT NULL THEN
+        PERFORM complaint_summary_add(OLD.hostel, OLD.date, OLD.issue_solved, OLD.complaint, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.hostel IS NOT NULL AND NEW.date IS NOT NULL THEN
+        PERFORM complaint_summary_add(NEW.hostel, NEW.date, NEW.issue_solved, NEW.complaint, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS complaint_summary ON complaint;
+CREATE TRIGGER complaint_summary
+    AFTER INSERT OR DELETE OR UPDATE OF hostel, date, issue_solved, complaint ON complaint
+    FOR EACH ROW EXECUTE FUNCTION complaint_summary_trigger();
+
+-- Rebuild the per-day tables from `since` on, then the all-time totals from them
+CREATE OR REPLACE FUNCTION complaint_summary_reconcile(since DATE) RETURNS INTEGER
+LANGUAGE plpgsql AS $$
+DECLARE
+    rebuilt INTEGER;
+BEGIN
+    -- Waits for transactions whose trigger already touched the counts, then holds off
+    -- new ones until commit: their upserts would otherwise collide with the plain
+    -- INSERTs below, and complaints committed mid-rebuild would be counted twice or not at all
+    LOCK TABLE complaint_daily_counts, complaint_issue_counts, complaint_status_counts IN EXCLUSIVE MODE;
+
+    DELETE FROM complaint_daily_counts WHERE day >= since;
+    INSERT INTO complaint_daily_counts (hostel, day, issue_solved, complaints)
+    SELECT hostel, date, issue_solved, count(*) FROM complaint
+    WHERE date >= since AND hostel IS NOT NULL AND date IS NOT NULL
+    GROUP BY hostel, date, issue_solved;
+    GET DIAGNOSTICS rebuilt = ROW_COUNT;
+
+    DELETE FROM complaint_issue_counts WHERE day >= since;
+    INSERT INTO complaint_issue_counts (hostel, day, issue, complaints)
+    SELECT hostel, date, complaint_issue_key(complaint), count(*) FROM complaint
+    WHERE date >= since AND hostel IS NOT NULL AND date IS NOT NULL
+    GROUP BY hostel, date, complaint_issue_key(complaint);
+
+    DELETE FROM complaint_status_counts;
+    INSERT INTO complaint_status_counts (hostel, issue_solved, complaints)
+    SELECT hostel, issue_solved, sum(complaints) FROM complaint_daily_counts
+    GROUP BY hostel, issue_solved;
+
+    DELETE FROM complaint_daily_counts WHERE complaints = 0;
+    DELETE FROM complaint_issue_counts WHERE complaints = 0;
+    RETURN rebuilt;
+END;
+$$;
+
+-- Backfill everything that is already there
+SELECT complaint_summary_reconcile('-infinity');
+
+COMMIT;
@@ -0,0 +1,35 @@
+-- Announce every new complaint on a per-hostel channel (complaints_bh1 ...
+-- complaints_bh5). functions/ComplaintFeed.py LISTENs on them and pushes the
+-- complaints to /complaints/stream subscribers. The notification is sent when
+-- the inserting transaction commits, never for rolled-back inserts.
+--
+--     psql "$DATABASE_URL" -v ON_ERROR_STOP=1 -f migrations/003_complaint_notify.sql
+
+BEGIN;
+
+CREATE OR REPLACE FUNCTION complaint_notify_trigger() RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+    -- Only the hostels ComplaintFeed listens for: hostel is free text, and an overlong
+    -- channel name would make pg_notify raise and take the INSERT down with it
+    IF upper(NEW.hostel) IN ('BH1', 'BH2', 'BH3', 'BH4', 'BH5') THEN
+        -- NOTIFY payloads are limited to 8000 bytes, so long complaint texts are cut
+        PERFORM pg_notify('complaints_' || lower(NEW.hostel), json_build_object(
+            'id', NEW.id,
+            'hostel', NEW.hostel,
+            'room_no', NEW.room_no,
+            'date', NEW.date,
+            'complaint', left(NEW.complaint, 1000),
+            'roll_no', NEW.roll_no
+        )::text);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS complaint_notify ON complaint;
+CREATE TRIGGER complaint_notify
+    AFTER INSERT ON complaint
+    FOR EACH ROW EXECUTE FUNCTION complaint_notify_trigger();
+
+COMMIT;
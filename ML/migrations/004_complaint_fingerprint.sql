@@ -0,0 +1,19 @@
+-- Duplicate detection for new complaints (functions/Complaints.py save_complaint_report).
+--
+-- Each report carries a fingerprint of hostel, room and normalized issue text.
+-- At most one open complaint may hold a given fingerprint, so a repeat report
+-- becomes INSERT ... ON CONFLICT DO UPDATE on that row's reporter_count instead
+-- of a new row, for as long as the first complaint stays open. Once it is
+-- resolved it drops out of the index and the next report opens a fresh one.
+-- Existing rows keep a NULL fingerprint and are never matched.
+--
+-- Adding the columns is a quick catalog change; the index is built CONCURRENTLY,
+-- which cannot run inside a transaction block:
+--     psql "$DATABASE_URL" -f migrations/004_complaint_fingerprint.sql
+
+ALTER TABLE complaint ADD COLUMN IF NOT EXISTS fingerprint TEXT;
+ALTER TABLE complaint ADD COLUMN IF NOT EXISTS reporter_count INTEGER NOT NULL DEFAULT 1;
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS complaint_open_fingerprint_idx
+    ON complaint (fingerprint)
+    WHERE NOT issue_solved AND fingerprint IS NOT NULL;
@@ -0,0 +1,16 @@
+-- Full-text search over complaint text for the complain-Search intent
+-- (functions/Complaints.py search_complaint_page).
+--
+-- An expression index rather than a stored tsvector column: adding a generated
+-- column would rewrite the whole table under an exclusive lock, while this
+-- builds alongside normal traffic. Queries must use the exact same expression,
+-- to_tsvector('english', complaint), for the planner to pick it. Hostel and
+-- date filters combine with it through the indexes from 001.
+--
+-- CONCURRENTLY cannot run inside a transaction block:
+--     psql "$DATABASE_URL" -f migrations/005_complaint_search.sql
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS complaint_search_idx
+    ON complaint USING GIN (to_tsvector('english', complaint));
+
+ANALYZE complaint;
@@ -0,0 +1,85 @@
+-- Count repeat reports in the complain-Summary issue counts. Since
+-- 004_complaint_fingerprint.sql a repeat report only bumps the open
+-- complaint's reporter_count, so the "most repeated issues" in
+-- complaint_issue_counts are now weighted by reporter_count, and the summary
+-- trigger fires on changes to it. complaint_daily_counts and
+-- complaint_status_counts still count complaints, one per row.
+-- Run after 002 and 004:
+--
+--     psql "$DATABASE_URL" -v ON_ERROR_STOP=1 -f migrations/006_complaint_summary_reports.sql
+
+BEGIN;
+
+DROP FUNCTION IF EXISTS complaint_summary_add(TEXT, DATE, BOOLEAN, TEXT, INTEGER);
+
+CREATE OR REPLACE FUNCTION complaint_summary_add(
+    p_hostel TEXT, p_day DATE, p_solved BOOLEAN, p_complaint TEXT, p_delta INTEGER, p_reports INTEGER
+) RETURNS VOID LANGUAGE sql AS $$
+    INSERT INTO complaint_daily_counts AS c (hostel, day, issue_solved, complaints)
+    VALUES (p_hostel, p_day, p_solved, p_delta)
+    ON CONFLICT (hostel, day, issue_solved) DO UPDATE SET complaints = c.complaints + EXCLUDED.complaints;
+
+    INSERT INTO complaint_issue_counts AS c (hostel, day, issue, complaints)
+    VALUES (p_hostel, p_day, complaint_issue_key(p_complaint), p_delta * p_reports)
+    ON CONFLICT (hostel, day, issue) DO UPDATE SET complaints = c.complaints + EXCLUDED.complaints;
+
+    INSERT INTO complaint_status_counts AS c (hostel, issue_solved, complaints)
+    VALUES (p_hostel, p_solved, p_delta)
+    ON CONFLICT (hostel, issue_solved) DO UPDATE SET complaints = c.complaints + EXCLUDED.complaints;
+$$;
+
+CREATE OR REPLACE FUNCTION complaint_summary_trigger() RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+    -- Rows without a hostel or date can't be bucketed; the reconcile skips them too
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.hostel IS NOT NULL AND OLD.date IS NOT NULL THEN
+        PERFORM complaint_summary_add(OLD.hostel, OLD.date, OLD.issue_solved, OLD.complaint, -1, OLD.reporter_count);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.hostel IS NOT NULL AND NEW.date IS NOT NULL THEN
+        PERFORM complaint_summary_add(NEW.hostel, NEW.date, NEW.issue_solved, NEW.complaint, 1, NEW.reporter_count);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS complaint_summary ON complaint;
+CREATE TRIGGER complaint_summary
+    AFTER INSERT OR DELETE OR UPDATE OF hostel, date, issue_solved, complaint, reporter_count ON complaint
+    FOR EACH ROW EXECUTE FUNCTION complaint_summary_trigger();
+
+-- As in 002, with issue counts summing reporter_count
+CREATE OR REPLACE FUNCTION complaint_summary_reconcile(since DATE) RETURNS INTEGER
+LANGUAGE plpgsql AS $$
+DECLARE
+    rebuilt INTEGER;
+BEGIN
+    LOCK TABLE complaint_daily_counts, complaint_issue_counts, complaint_status_counts IN EXCLUSIVE MODE;
+
+    DELETE FROM complaint_daily_counts WHERE day >= since;
+    INSERT INTO complaint_daily_counts (hostel, day, issue_solved, complaints)
+    SELECT hostel, date, issue_solved, count(*) FROM complaint
+    WHERE date >= since AND hostel IS NOT NULL AND date IS NOT NULL
+    GROUP BY hostel, date, issue_solved;
+    GET DIAGNOSTICS rebuilt = ROW_COUNT;
+
+    DELETE FROM complaint_issue_counts WHERE day >= since;
+    INSERT INTO complaint_issue_counts (hostel, day, issue, complaints)
+    SELECT hostel, date, complaint_issue_key(complaint), sum(reporter_count) FROM complaint
+    WHERE date >= since AND hostel IS NOT NULL AND date IS NOT NULL
+    GROUP BY hostel, date, complaint_issue_key(complaint);
+
+    DELETE FROM complaint_status_counts;
+    INSERT INTO complaint_status_counts (hostel, issue_solved, complaints)
+    SELECT hostel, issue_solved, sum(complaints) FROM complaint_daily_counts
+    GROUP BY hostel, issue_solved;
+
+    DELETE FROM complaint_daily_counts WHERE complaints = 0;
+    DELETE FROM complaint_issue_counts WHERE complaints = 0;
+    RETURN rebuilt;
+END;
+$$;
+
+-- Re-weight the issue counts already there
+SELECT complaint_summary_reconcile('-infinity');
+
+COMMIT;
@@ -0,0 +1,76 @@
+"""
+Signed access tokens for the complaint dashboard endpoints (/complaints/export,
+/complaints/stream). A token names a role ("warden" or a hostel) and an expiry,
+and is signed with COMPLAINTS_API_SECRET, so holding one is the credential:
+unlike a Dialogflow session id, it can't be made up by the caller.
+
+Mint one for a dashboard with:
+
+    COMPLAINTS_API_SECRET=... python -m utils.auth warden --days 30
+"""
+import argparse
+import hashlib
+import hmac
+import os
+import time
+
+# Unset disables the endpoints that need a token
+COMPLAINTS_API_SECRET = os.getenv("COMPLAINTS_API_SECRET", "")
+TOKEN_DAYS = float(os.getenv("COMPLAINTS_TOKEN_DAYS", "30"))
+
+
+class AuthError(PermissionError):
+    """Missing, malformed, forged or expired token"""
+
+
+def _signature(secret, payload):
+    return hmac.new(secret.encode(), payload.encode(), hashlib.sha256).hexdigest()
+
+
+def issue_token(role, days=TOKEN_DAYS, secret=COMPLAINTS_API_SECRET):
+    if not secret:
+        raise ValueError("COMPLAINTS_API_SECRET is not set")
+    if not role or '.' in role:
+        raise ValueError(f"Invalid role '{role}'")
+    payload = f"{role}.{int(time.time() + days * 86400)}"
+    return f"{payload}.{_signature(secret, payload)}"
+
+
+def verify_token(token, secret=COMPLAINTS_API_SECRET):
+    """Role the token was issued for. Raises AuthError if it isn't valid."""
+    if not secret:
+        # Anyone can sign with an empty key
+        raise AuthError("Access tokens are not configured.")
+    if not token:
+        raise AuthError("An access token is required.")
+    payload, _, signature = token.rpartition('.')
+    role, _, expires = payload.partition('.')
+    if not role or not hmac.compare_digest(signature.encode(), _signature(secret, payload).encode()):
+        raise AuthError("Invalid access token.")
+    if not expires.isdigit() or int(expires) < time.time():
+        raise AuthError("The access token has expired.")
+    return role
+
+
+def request_token(request):
+    """
+    Token from an "Authorization: Bearer" header, or the `token` query parameter
+    for clients that can't set headers (EventSource, download links)
+    """
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() == 'bearer' and token.strip():
+        return token.strip()
+    return request.args.get('token', '')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mint a complaint dashboard access token")
+    parser.add_argument("role", help="warden, or a hostel such as BH1")
+    parser.add_argument("--days", type=float, default=TOKEN_DAYS, help="validity in days")
+    args = parser.parse_args()
+    role = "warden" if args.role.lower() == "warden" else args.role.upper()
+    print(issue_token(role, args.days))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import logging
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+from utils.metrics import collector
+
+_registry = weakref.WeakValueDictionary()
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries expire after `ttl` seconds.
+
+    With `stale_ttl` > 0, get_or_load() keeps serving an expired entry for that
+    many extra seconds while a single background thread reloads it
+    (stale-while-revalidate). Loader results of None are never stored.
+    """
+
+    def __init__(self, maxsize=128, ttl=300, stale_ttl=0, name=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.name = name or 'cache'
+
+        self._data = OrderedDict()  # key -> (value, stored_at)
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._loading = {}  # key -> Lock, so concurrent misses load once
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        _registry[self.name] = self
+
+    def __len__(self):
+        return len(self._data)
+
+    def _lookup(self, key, now):
+        """Return (value, age) for a live entry, or None. Caller holds the lock."""
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, stored_at = entry
+        age = now - stored_at
+        if age > self.ttl + self.stale_ttl:
+            del self._data[key]
+            self.evictions += 1
+            return None
+        self._data.move_to_end(key)
+        return value, age
+
+    def get(self, key, default=None):
+        """Return a fresh value, or `default` if missing or expired"""
+        with self._lock:
+            found = self._lookup(key, time.monotonic())
+            if found is None or found[1] > self.ttl:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return found[0]
+
+    def get_with_age(self, key):
+        """Return (value, age_seconds) including stale entries, or (None, None)"""
+        with self._lock:
+            found = self._lookup(key, time.monotonic())
+        return found if found is not None else (None, None)
+
+    def set(self, key, value, stored_at=None):
+        if value is None:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() if stored_at is None else stored_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def get_or_load(self, key, loader):
+        """
+        Return the cached value for `key`, calling `loader()` on a miss.
+        Stale entries are returned immediately and refreshed in the background.
+        """
+        with self._lock:
+            found = self._lookup(key, time.monotonic())
+            if found is not None:
+                value, age = found
+                if age <= self.ttl:
+                    self.hits += 1
+                    return value
+                self.stale_hits += 1
+                if key not in self._refreshing:
+                    self._refreshing.add(key)
+                    threading.Thread(target=self._refresh, args=(key, loader), daemon=True).start()
+                return value
+            self.misses += 1
+            load_lock = self._loading.setdefault(key, threading.Lock())
+
+        with load_lock:
+            # Another caller may have loaded it while we waited
+            with self._lock:
+                found = self._lookup(key, time.monotonic())
+            if found is not None and found[1] <= self.ttl:
+                return found[0]
+            try:
+                value = loader()
+                self.set(key, value)
+                return value
+            finally:
+                with self._lock:
+                    self._loading.pop(key, None)
+
+    def _refresh(self, key, loader):
+        try:
+            self.set(key, loader())
+        except Exception as e:
+            logging.warning(f"Background refresh of {self.name}[{key!r}] failed: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                'size': len(self._data),
+                'max_size': self.maxsize,
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round((self.hits + self.stale_hits) / lookups, 3) if lookups else 0.0,
+            }
+
+
+def cache_stats():
+    """Stats of every live named TTLCache in the process"""
+    return {name: cache.stats() for name, cache in list(_registry.items())}
+
+
+@collector
+def cache_metrics():
+    stats = cache_stats()
+    families = []
+    for key, kind in (('hits', 'counter'), ('stale_hits', 'counter'), ('misses', 'counter'),
+                      ('evictions', 'counter'), ('size', 'gauge')):
+        families.append((f'ml_cache_{key}', kind, f'TTLCache {key.replace("_", " ")}',
+                         [({'cache': name}, s[key]) for name, s in stats.items()]))
+    return families
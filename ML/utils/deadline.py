@@ -0,0 +1,73 @@
+import contextvars
+import os
+import time
+
+import requests
+
+# Dialogflow gives up on the webhook after ~5 s; answer comfortably before that
+WEBHOOK_BUDGET = float(os.getenv("WEBHOOK_BUDGET", "4.5"))
+
+_current = contextvars.ContextVar('deadline', default=None)
+
+
+class DeadlineExceeded(requests.exceptions.Timeout):
+    """The webhook's time budget ran out before this call could start"""
+
+
+class Deadline:
+    """
+    Point in time by which the current webhook call has to answer.
+
+    Outbound calls made while it is bound cap their timeouts to what's left.
+    Once the webhook has answered without the handler (release()), the handler
+    keeps running in the background with normal timeouts to fill the caches.
+    """
+    __slots__ = ('expires_at', 'released')
+
+    def __init__(self, budget):
+        self.expires_at = time.monotonic() + budget
+        self.released = False
+
+    def remaining(self):
+        """Seconds left, or None once released"""
+        if self.released:
+            return None
+        return self.expires_at - time.monotonic()
+
+    def allows(self, seconds):
+        remaining = self.remaining()
+        return remaining is None or remaining > seconds
+
+    def release(self):
+        self.released = True
+
+    def cap(self, timeout):
+        """`timeout` (a number or a (connect, read) tuple) cut down to the time left"""
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        if remaining <= 0:
+            raise DeadlineExceeded("Webhook deadline reached")
+        if isinstance(timeout, tuple):
+            return tuple(min(t, remaining) for t in timeout)
+        return remaining if timeout is None else min(timeout, remaining)
+
+
+def current_deadline():
+    return _current.get()
+
+
+def run_with_deadline(deadline, func, *args):
+    """Call func(*args) with `deadline` bound for every outbound call it makes"""
+    token = _current.set(deadline)
+    try:
+        return func(*args)
+    finally:
+        _current.reset(token)
+
+
+def capped(timeout):
+    """`timeout` capped to the current deadline, never below zero; unchanged outside one"""
+    deadline = _current.get()
+    remaining = deadline.remaining() if deadline else None
+    return timeout if remaining is None else max(0.0, min(timeout, remaining))
@@ -0,0 +1,269 @@
+import contextvars
+import copy
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from utils.cache import TTLCache
+from utils.deadline import Deadline, run_with_deadline
+from utils.metrics import counter, histogram
+
+try:
+    import gevent
+    from gevent import monkey
+except ImportError:  # threaded servers and local runs
+    gevent = None
+
+# Handler threads per process when not running under gevent (which gets a greenlet per call)
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "32"))
+WEBHOOK_ANSWER_CACHE_SIZE = int(os.getenv("WEBHOOK_ANSWER_CACHE_SIZE", "2048"))
+WEBHOOK_ANSWER_TTL = int(os.getenv("WEBHOOK_ANSWER_TTL", "86400"))
+
+STILL_FETCHING = "I'm still fetching that for you. Please ask again in a few seconds."
+STILL_WORKING = "This is taking longer than usual, but it's still being processed. Please check again in a moment."
+
+WEBHOOK_SECONDS = histogram('ml_webhook_request_seconds', 'Intent handler latency', ('intent',))
+WEBHOOK_ERRORS = counter('ml_webhook_errors', 'Intent handlers that raised', ('intent',))
+WEBHOOK_TIMEOUTS = counter('ml_webhook_deadline_exceeded', 'Calls answered without the handler because it ran past the budget', ('intent',))
+WEBHOOK_UNHANDLED = counter('ml_webhook_unhandled', 'Calls for intents without a handler')
+
+_HANDLER_TIMEOUTS = (FutureTimeout, gevent.Timeout) if gevent else (FutureTimeout,)
+
+_reply = contextvars.ContextVar('webhook_reply', default=None)
+
+
+class _Reply:
+    __slots__ = ('replayable',)
+
+    def __init__(self):
+        self.replayable = True
+
+
+def no_replay():
+    """
+    Keep the reply being built out of the saved answers, e.g. because it is an
+    error text. Does nothing outside a webhook call (such as in a background refresh).
+    """
+    reply = _reply.get()
+    if reply is not None:
+        reply.replayable = False
+
+
+class WebhookRequest:
+    """
+    Pre-parsed view of a Dialogflow webhook request.
+    The queryResult is walked once here so handlers don't have to.
+    """
+    __slots__ = ('raw', 'session', 'session_id', 'intent', 'query_text',
+                 'parameters', 'output_contexts', 'display_name', 'role')
+
+    def __init__(self, req, identify=None):
+        self.raw = req
+        self.session = req.get('session', '')
+        self.session_id = self.session.split('/')[-1]
+
+        query_result = req.get('queryResult') or {}
+        self.intent = (query_result.get('intent') or {}).get('displayName', '')
+        self.query_text = query_result.get('queryText', '')
+        self.parameters = query_result.get('parameters') or {}
+        self.output_contexts = query_result.get('outputContexts') or []
+
+        if identify:
+            self.display_name, self.role = identify(self.session_id)
+        else:
+            self.display_name, self.role = 'UNKNOWN', None
+
+    def param(self, name, default=''):
+        return self.parameters.get(name, default)
+
+    def context(self, name):
+        """Return the parameters of the active output context called `name`, or None"""
+        for context in self.output_contexts:
+            if name in context.get('name', ''):
+                return context.get('parameters') or {}
+        return None
+
+    def context_name(self, name):
+        return f"{self.session}/contexts/{name}"
+
+    def answer_key(self):
+        """Identifies requests that get the same answer: intent, parameters and non-system contexts"""
+        contexts = {}
+        for context in self.output_contexts:
+            short_name = context.get('name', '').rsplit('/', 1)[-1]
+            if not short_name.startswith('__'):
+                contexts[short_name] = context.get('parameters') or {}
+        return json.dumps([self.intent, self.parameters, contexts], sort_keys=True, default=str)
+
+
+class LatencyStats:
+    """Call count, error count and a bounded window of recent latencies for one intent"""
+
+    def __init__(self, name='', window=1024):
+        self._latency = WEBHOOK_SECONDS.labels(name)
+        self._errors = WEBHOOK_ERRORS.labels(name)
+        self._timeouts = WEBHOOK_TIMEOUTS.labels(name)
+        self.count = 0
+        self.errors = 0
+        self.timeouts = 0
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, elapsed, failed=False):
+        self._latency.observe(elapsed)
+        if failed:
+            self._errors.inc()
+        with self._lock:
+            self.count += 1
+            if failed:
+                self.errors += 1
+            self._samples.append(elapsed)
+
+    def record_timeout(self):
+        self._timeouts.inc()
+        with self._lock:
+            self.timeouts += 1
+
+    def snapshot(self):
+        with self._lock:
+            samples = sorted(self._samples)
+            count, errors, timeouts = self.count, self.errors, self.timeouts
+
+        def percentile(p):
+            if not samples:
+                return None
+            index = min(len(samples) - 1, int(round(p / 100.0 * (len(samples) - 1))))
+            return round(samples[index] * 1000, 1)
+
+        return {
+            'count': count,
+            'errors': errors,
+            'timeouts': timeouts,
+            'p50_ms': percentile(50),
+            'p95_ms': percentile(95),
+            'p99_ms': percentile(99),
+        }
+
+
+class IntentDispatcher:
+    """
+    Registry of intent handlers keyed by Dialogflow intent displayName.
+
+    Handlers are registered with the `intent` decorator, receive a WebhookRequest
+    and return the response dict. Lookup is a single dict access, so adding an
+    intent doesn't slow down dispatch for the others.
+
+    With a `budget` (seconds), handlers run under a Deadline (in a greenlet of
+    their own under gevent, on a thread pool otherwise) and dispatch() answers
+    within the budget no matter what: a handler that runs over keeps going in
+    the background, and the caller gets the last answer to the same question
+    (flagged as possibly out of date) or a "still fetching" reply. Intents
+    with side effects register with replay=False so an old answer is never
+    replayed for them, and replies flagged with no_replay() (error texts) are
+    never saved.
+    """
+
+    def __init__(self, identify=None, fallback=None, budget=None, workers=WEBHOOK_WORKERS):
+        self._handlers = {}
+        self._replayable = {}
+        self._stats = {}
+        self._identify = identify
+        self._fallback = fallback
+        self.budget = budget if budget and budget > 0 else None
+        # A fixed pool would cap a gevent worker at `workers` concurrent handlers however many
+        # connections it accepts, and queued calls would burn their budget before starting
+        self._greenlets = gevent is not None and monkey.is_module_patched('threading')
+        self._executor = None
+        if self.budget and not self._greenlets:
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='webhook')
+        self._answers = TTLCache(maxsize=WEBHOOK_ANSWER_CACHE_SIZE, ttl=WEBHOOK_ANSWER_TTL, name='webhook_answers')
+
+    def intent(self, name, replay=True):
+        def register(handler):
+            if name in self._handlers:
+                raise ValueError(f"Intent '{name}' is already registered")
+            self._handlers[name] = handler
+            self._replayable[name] = replay
+            self._stats[name] = LatencyStats(name)
+            return handler
+        return register
+
+    def parse(self, req):
+        return WebhookRequest(req, self._identify)
+
+    def _run(self, handler, webhook_request, stats, reply=None):
+        start = time.perf_counter()
+        token = _reply.set(reply)
+        try:
+            result = handler(webhook_request)
+        except Exception:
+            stats.record(time.perf_counter() - start, failed=True)
+            raise
+        finally:
+            _reply.reset(token)
+        stats.record(time.perf_counter() - start)
+        return result
+
+    def dispatch(self, req):
+        webhook_request = req if isinstance(req, WebhookRequest) else self.parse(req)
+        handler = self._handlers.get(webhook_request.intent)
+        if handler is None:
+            WEBHOOK_UNHANDLED.inc()
+            return self._fallback(webhook_request) if self._fallback else None
+
+        stats = self._stats[webhook_request.intent]
+        if self.budget is None:
+            return self._run(handler, webhook_request, stats)
+
+        deadline = Deadline(self.budget)
+        replay = self._replayable[webhook_request.intent]
+        key = webhook_request.answer_key() if replay else None
+        reply = _Reply()
+        call = (run_with_deadline, deadline, self._run, handler, webhook_request, stats, reply)
+        try:
+            if self._greenlets:
+                task = gevent.spawn(*call)
+                if replay:
+                    task.link_value(lambda t: self._remember(key, reply, t.value))
+                return task.get(timeout=max(0.0, deadline.remaining()))
+            future = self._executor.submit(*call)
+            if replay:
+                future.add_done_callback(lambda f: self._remember_future(key, reply, f))
+            return future.result(timeout=max(0.0, deadline.remaining()))
+        except _HANDLER_TIMEOUTS:
+            deadline.release()
+            stats.record_timeout()
+            logging.warning(f"Intent {webhook_request.intent} ran past the {self.budget}s budget, answering without it")
+            return self._late_answer(webhook_request, key)
+
+    def _remember(self, key, reply, answer):
+        if reply.replayable and answer is not None:
+            self._answers.set(key, answer)
+
+    def _remember_future(self, key, reply, future):
+        if future.exception() is None:
+            self._remember(key, reply, future.result())
+
+    def _late_answer(self, webhook_request, key):
+        if key is None:
+            return {'fulfillmentText': STILL_WORKING}
+        answer, age = self._answers.get_with_age(key)
+        if answer is None:
+            return {'fulfillmentText': STILL_FETCHING}
+
+        answer = copy.deepcopy(answer)
+        minutes = int(age // 60)
+        when = f"{minutes} minutes ago" if minutes < 120 else f"{minutes // 60} hours ago"
+        if answer.get('fulfillmentText'):
+            answer['fulfillmentText'] += f"\n\n(Saved answer from {when}, it may be out of date. Fetching the latest now.)"
+        # Contexts in the stored answer belong to whoever asked first
+        for context in answer.get('outputContexts', []):
+            context['name'] = webhook_request.context_name(context['name'].rsplit('/', 1)[-1])
+        return answer
+
+    def stats(self):
+        return {name: stats.snapshot() for name, stats in self._stats.items()}
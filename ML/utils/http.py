@@ -0,0 +1,271 @@
+import hashlib
+import logging
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.deadline import current_deadline
+from utils.metrics import counter, histogram
+
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3.05"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "10"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "20"))
+HTTP_MAX_PER_HOST = int(os.getenv("HTTP_MAX_PER_HOST", "8"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "2"))
+HTTP_BACKOFF = float(os.getenv("HTTP_BACKOFF", "0.3"))
+# Pages whose validators and last extraction result are kept for conditional GETs
+HTTP_VALIDATOR_CACHE = int(os.getenv("HTTP_VALIDATOR_CACHE", "512"))
+
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS'])
+RETRY_STATUSES = frozenset([502, 503, 504])
+
+UPSTREAM_SECONDS = histogram('ml_upstream_request_seconds', 'Outbound HTTP latency per attempt', ('upstream',))
+UPSTREAM_ERRORS = counter('ml_upstream_errors', 'Outbound HTTP attempts that failed or returned 5xx', ('upstream',))
+UPSTREAM_RETRIES = counter('ml_upstream_retries', 'Outbound HTTP retries', ('upstream',))
+UPSTREAM_REUSED = counter('ml_upstream_reused', 'Conditional GETs answered from the previous extraction',
+                          ('upstream', 'reason'))
+
+
+class HostBusy(requests.exceptions.ConnectionError):
+    """Too many requests to one host are already in flight"""
+
+
+class HostStats:
+    __slots__ = ('requests', 'errors', 'retries', 'in_flight', 'total_time', 'max_time', 'not_modified',
+                 'unchanged', 'latency', 'error_count', 'retry_count', 'not_modified_count', 'unchanged_count')
+
+    def __init__(self, upstream):
+        self.name(upstream)
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.in_flight = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.not_modified = 0
+        self.unchanged = 0
+
+    def name(self, upstream):
+        self.latency = UPSTREAM_SECONDS.labels(upstream)
+        self.error_count = UPSTREAM_ERRORS.labels(upstream)
+        self.retry_count = UPSTREAM_RETRIES.labels(upstream)
+        self.not_modified_count = UPSTREAM_REUSED.labels(upstream, 'not_modified')
+        self.unchanged_count = UPSTREAM_REUSED.labels(upstream, 'unchanged')
+
+    def snapshot(self):
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'retries': self.retries,
+            'in_flight': self.in_flight,
+            'not_modified': self.not_modified,
+            'unchanged': self.unchanged,
+            'avg_ms': round(self.total_time / self.requests * 1000, 1) if self.requests else 0.0,
+            'max_ms': round(self.max_time * 1000, 1),
+        }
+
+
+class Validators:
+    """What we know about the last 200 response for a URL, and what was extracted from it"""
+    __slots__ = ('etag', 'last_modified', 'digest', 'result')
+
+    def __init__(self, etag, last_modified, digest, result):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.digest = digest
+        self.result = result
+
+
+class HttpClient:
+    """
+    Shared keep-alive HTTP client for all outbound calls.
+
+    One requests.Session with a pooled adapter, so connections to Koha, DSpace,
+    lnmiit.ac.in and the slots API are reused. Each host gets a concurrency cap,
+    default connect/read timeouts apply when the caller passes none, and
+    idempotent requests are retried with jittered exponential backoff on
+    connection errors and 502/503/504.
+    """
+
+    def __init__(self, pool_size=HTTP_POOL_SIZE, max_per_host=HTTP_MAX_PER_HOST,
+                 timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT), retries=HTTP_RETRIES,
+                 backoff=HTTP_BACKOFF, host_limits=None):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_per_host = max_per_host
+        self.host_limits = host_limits or {}
+
+        self._slots = {}
+        self._stats = {}
+        self._upstreams = {}  # host -> name used in metrics
+        self._validators = OrderedDict()  # full URL -> Validators, LRU
+        self.validator_cache_size = HTTP_VALIDATOR_CACHE
+        self._lock = threading.Lock()
+
+    def _host(self, host):
+        with self._lock:
+            slot = self._slots.get(host)
+            if slot is None:
+                slot = self._slots[host] = threading.BoundedSemaphore(self.host_limits.get(host, self.max_per_host))
+                self._stats[host] = HostStats(self._upstreams.get(host, host))
+            return slot, self._stats[host]
+
+    def name_upstream(self, url, name):
+        """Report requests to the host of `url` as `name` (e.g. 'koha') in metrics"""
+        host = urlsplit(url).netloc
+        with self._lock:
+            self._upstreams[host] = name
+            if host in self._stats:
+                self._stats[host].name(name)
+
+    def _retry_delay(self, attempt):
+        return self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+
+    def request(self, method, url, retries=None, timeout=None, **kwargs):
+        method = method.upper()
+        host = urlsplit(url).netloc
+        slot, stats = self._host(host)
+        timeout = self.timeout if timeout is None else timeout
+        retries = self.retries if retries is None else retries
+        attempts = 1 + (retries if method in IDEMPOTENT_METHODS else 0)
+        deadline = current_deadline()
+
+        attempt = 0
+        while True:
+            last_attempt = attempt >= attempts - 1
+            # While the webhook is still waiting, no attempt may outlive its deadline
+            attempt_timeout = deadline.cap(timeout) if deadline else timeout
+            delay = self._retry_delay(attempt)
+            can_retry = not last_attempt and (deadline is None or deadline.allows(delay))
+            # Wait for a free slot no longer than we'd wait to connect
+            slot_wait = attempt_timeout[0] if isinstance(attempt_timeout, tuple) else attempt_timeout
+            if not slot.acquire(timeout=slot_wait):
+                with self._lock:
+                    stats.errors += 1
+                stats.error_count.inc()
+                raise HostBusy(f"Too many concurrent requests to {host}")
+            with self._lock:
+                stats.in_flight += 1
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, timeout=attempt_timeout, **kwargs)
+            except requests.exceptions.RequestException as e:
+                self._record(stats, start, failed=True)
+                if (isinstance(e, requests.exceptions.Timeout) and attempt_timeout != timeout
+                        and deadline.released):
+                    # Cut short for a webhook that has since answered without us;
+                    # finish the fetch in the background so the caches get filled
+                    logging.info(f"{method} {host} hit the webhook deadline, continuing in background")
+                    continue
+                if not can_retry:
+                    raise
+                logging.warning(f"{method} {host} attempt {attempt + 1} failed: {e}")
+            else:
+                failed = response.status_code >= 500
+                self._record(stats, start, failed=failed)
+                if not can_retry or response.status_code not in RETRY_STATUSES:
+                    return response
+                response.close()
+                logging.warning(f"{method} {host} attempt {attempt + 1} returned {response.status_code}")
+            finally:
+                with self._lock:
+                    stats.in_flight -= 1
+                slot.release()
+
+            with self._lock:
+                stats.retries += 1
+            stats.retry_count.inc()
+            time.sleep(delay)
+            attempt += 1
+
+    def _record(self, stats, start, failed):
+        elapsed = time.perf_counter() - start
+        stats.latency.observe(elapsed)
+        if failed:
+            stats.error_count.inc()
+        with self._lock:
+            stats.requests += 1
+            stats.total_time += elapsed
+            if elapsed > stats.max_time:
+                stats.max_time = elapsed
+            if failed:
+                stats.errors += 1
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def get_extracted(self, url, extract, params=None, **kwargs):
+        """
+        GET `url` and return extract(response), skipping both the download and
+        the extraction when the page hasn't changed since the last call.
+
+        The ETag / Last-Modified of the last 200 response are sent back as
+        If-None-Match / If-Modified-Since; on 304 the previous result is
+        returned. Servers without validators still send the page, but a body
+        with the same sha256 as last time reuses the previous result instead
+        of being parsed again. extract() sees every other response (errors
+        included) and its None results aren't remembered.
+        """
+        key = requests.Request('GET', url, params=params).prepare().url
+        with self._lock:
+            previous = self._validators.get(key)
+            if previous is not None:
+                self._validators.move_to_end(key)
+
+        headers = dict(kwargs.pop('headers', None) or {})
+        if previous is not None:
+            if previous.etag:
+                headers['If-None-Match'] = previous.etag
+            if previous.last_modified:
+                headers['If-Modified-Since'] = previous.last_modified
+
+        response = self.get(url, params=params, headers=headers, **kwargs)
+        stats = self._host(urlsplit(url).netloc)[1]
+        if response.status_code == 304 and previous is not None:
+            with self._lock:
+                stats.not_modified += 1
+            stats.not_modified_count.inc()
+            return previous.result
+        if response.status_code != 200:
+            return extract(response)
+
+        digest = hashlib.sha256(response.content).digest()
+        if previous is not None and digest == previous.digest:
+            with self._lock:
+                stats.unchanged += 1
+            stats.unchanged_count.inc()
+            result = previous.result
+        else:
+            result = extract(response)
+            if result is None:
+                return None
+
+        entry = Validators(response.headers.get('ETag'), response.headers.get('Last-Modified'), digest, result)
+        with self._lock:
+            self._validators[key] = entry
+            self._validators.move_to_end(key)
+            while len(self._validators) > self.validator_cache_size:
+                self._validators.popitem(last=False)
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {host: stats.snapshot() for host, stats in self._stats.items()}
+
+
+client = HttpClient()
@@ -0,0 +1,144 @@
+import logging
+import os
+import threading
+import time
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+from utils.metrics import histogram
+
+try:
+    import lxml  # noqa: F401
+    DEFAULT_PARSER = "lxml"
+except ImportError:
+    DEFAULT_PARSER = "html.parser"
+
+HTML_PARSER = os.getenv("HTML_PARSER", DEFAULT_PARSER)
+
+PARSE_SECONDS = histogram('ml_html_parse_seconds', 'Time to parse a scraped page', ('page',))
+
+
+class ParseTargets:
+    """
+    The parts of a page an extractor reads: tag names, ids, classes and
+    Elementor data-id containers. Only top-level matches and their subtrees are
+    kept when parsing, so anything reached with find_next() must be listed too.
+    """
+    __slots__ = ('names', 'ids', 'classes', 'data_ids')
+
+    def __init__(self, names=(), ids=(), classes=(), data_ids=()):
+        self.names = frozenset(names)
+        self.ids = frozenset(ids)
+        self.classes = frozenset(classes)
+        self.data_ids = frozenset(data_ids)
+
+    def union(self, other):
+        return ParseTargets(self.names | other.names, self.ids | other.ids,
+                            self.classes | other.classes, self.data_ids | other.data_ids)
+
+    def matches(self, name, attrs):
+        if name in self.names:
+            return True
+        if self.ids and attrs.get('id') in self.ids:
+            return True
+        if self.data_ids and attrs.get('data-id') in self.data_ids:
+            return True
+        if self.classes:
+            classes = attrs.get('class') or ()
+            if isinstance(classes, str):
+                classes = classes.split()
+            return not self.classes.isdisjoint(classes)
+        return False
+
+    def strainer(self):
+        return TargetStrainer(self)
+
+
+class TargetStrainer(SoupStrainer):
+    """SoupStrainer that keeps top-level tags matching a ParseTargets"""
+
+    def __init__(self, targets):
+        super().__init__()
+        self.targets = targets
+
+    # bs4 >= 4.13 asks before creating each tag outside a kept subtree
+    def allow_tag_creation(self, nsprefix, name, attrs):
+        return self.targets.matches(name, attrs or {})
+
+    # bs4 < 4.13 asks through search_tag(name, attrs)
+    def search_tag(self, markup_name=None, markup_attrs={}):
+        if hasattr(markup_name, 'attrs'):
+            markup_name, markup_attrs = markup_name.name, markup_name.attrs
+        return markup_name if self.targets.matches(markup_name, markup_attrs or {}) else None
+
+
+def parses(names=(), ids=(), classes=(), data_ids=()):
+    """Declare which parts of the page an extractor function reads"""
+    def decorate(func):
+        func.parse_targets = ParseTargets(names, ids, classes, data_ids)
+        return func
+    return decorate
+
+
+def targets_of(*extractors):
+    """Union of the declared targets, or None (parse everything) if any extractor didn't declare"""
+    targets = None
+    for extractor in extractors:
+        declared = getattr(extractor, 'parse_targets', None)
+        if declared is None:
+            return None
+        targets = declared if targets is None else targets.union(declared)
+    return targets
+
+
+class ParseStats:
+    def __init__(self):
+        self.calls = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.last_nodes = 0
+        self.last_bytes = 0
+
+    def snapshot(self):
+        return {
+            'calls': self.calls,
+            'avg_ms': round(self.total_time / self.calls * 1000, 2) if self.calls else 0.0,
+            'max_ms': round(self.max_time * 1000, 2),
+            'last_nodes': self.last_nodes,
+            'last_bytes': self.last_bytes,
+        }
+
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def parse_html(content, targets=None, name='html'):
+    """
+    Parse `content` with the C-backed lxml parser when installed, keeping only the
+    subtrees described by `targets` (a ParseTargets). Parse time and tree size are
+    recorded under `name`.
+    """
+    start = time.perf_counter()
+    soup = BeautifulSoup(content, HTML_PARSER, parse_only=targets.strainer() if targets else None)
+    elapsed = time.perf_counter() - start
+    nodes = sum(1 for _ in soup.descendants)
+    PARSE_SECONDS.labels(name).observe(elapsed)
+
+    with _stats_lock:
+        stats = _stats.get(name)
+        if stats is None:
+            stats = _stats[name] = ParseStats()
+        stats.calls += 1
+        stats.total_time += elapsed
+        stats.max_time = max(stats.max_time, elapsed)
+        stats.last_nodes = nodes
+        stats.last_bytes = len(content)
+
+    logging.debug(f"Parsed {name}: {len(content)} bytes -> {nodes} nodes in {elapsed * 1000:.1f} ms ({HTML_PARSER})")
+    return soup
+
+
+def parse_stats():
+    with _stats_lock:
+        return {name: stats.snapshot() for name, stats in _stats.items()}
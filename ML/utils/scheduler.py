@@ -0,0 +1,161 @@
+import logging
+import random
+import threading
+import time
+
+from utils.metrics import collector
+
+
+class Snapshot:
+    """Last good result of a refresh job, published by swapping one reference"""
+    __slots__ = ('value', 'fetched_at')
+
+    def __init__(self, value, fetched_at=None):
+        self.value = value
+        self.fetched_at = time.time() if fetched_at is None else fetched_at
+
+    @property
+    def age(self):
+        return time.time() - self.fetched_at
+
+
+class RefreshJob:
+    def __init__(self, name, func, interval, jitter, backoff, max_backoff):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self.snapshot = None
+        self.failures = 0
+        self.last_error = None
+        self.last_duration = None
+        self.running = False
+        self.next_run = None
+
+    def next_delay(self):
+        if self.failures:
+            delay = min(self.max_backoff, self.backoff * 2 ** (self.failures - 1))
+        else:
+            delay = self.interval
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def run_once(self):
+        self.running = True
+        start = time.monotonic()
+        try:
+            value = self.func()
+            if value is None:
+                raise ValueError("refresh returned no data")
+        except Exception as e:
+            self.failures += 1
+            self.last_error = str(e)
+            logging.warning(f"Refresh of {self.name} failed ({self.failures} in a row): {e}")
+            return False
+        finally:
+            self.last_duration = time.monotonic() - start
+            self.running = False
+        self.snapshot = Snapshot(value)
+        self.failures = 0
+        self.last_error = None
+        return True
+
+
+class RefreshScheduler:
+    """
+    Refreshes registered sources on their own daemon thread each, so a slow
+    upstream never delays the others. Handlers read `snapshot(name)` and keep
+    getting the last good value while a refresh is running or failing.
+    """
+
+    def __init__(self):
+        self._jobs = {}
+        self._stop = threading.Event()
+        self._started = False
+        self._lock = threading.Lock()
+
+    def register(self, name, func, interval, jitter=0.1, backoff=30, max_backoff=None):
+        if name in self._jobs:
+            raise ValueError(f"Refresh job '{name}' is already registered")
+        job = RefreshJob(name, func, interval, jitter, backoff, max_backoff or interval)
+        self._jobs[name] = job
+        if self._started:
+            self._spawn(job)
+        return job
+
+    def _spawn(self, job):
+        threading.Thread(target=self._loop, args=(job,), name=f"refresh-{job.name}", daemon=True).start()
+
+    def _loop(self, job):
+        # Spread the first runs out a little so workers don't all hit the site together
+        delay = random.uniform(0, min(5.0, job.interval * job.jitter))
+        while not self._stop.wait(delay):
+            job.run_once()
+            delay = job.next_delay()
+            job.next_run = time.time() + delay
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        for job in self._jobs.values():
+            self._spawn(job)
+
+    def stop(self):
+        self._stop.set()
+
+    @property
+    def running(self):
+        return self._started and not self._stop.is_set()
+
+    def seed(self, name, value, fetched_at=None):
+        """Publish a value obtained elsewhere (e.g. loaded from disk) until the job's next run"""
+        self._jobs[name].snapshot = Snapshot(value, fetched_at)
+
+    def snapshot(self, name):
+        job = self._jobs.get(name)
+        return job.snapshot if job else None
+
+    def stats(self):
+        stats = {}
+        for name, job in self._jobs.items():
+            snapshot = job.snapshot
+            stats[name] = {
+                'age_s': round(snapshot.age, 1) if snapshot else None,
+                'failures': job.failures,
+                'last_error': job.last_error,
+                'last_duration_ms': round(job.last_duration * 1000, 1) if job.last_duration is not None else None,
+                'refreshing': job.running,
+                'next_run_in_s': round(job.next_run - time.time(), 1) if job.next_run else None,
+            }
+        return stats
+
+
+def describe_age(snapshot, fresh_for):
+    """A short note for answers served from a snapshot older than `fresh_for` seconds"""
+    if snapshot is None or snapshot.age <= fresh_for:
+        return ""
+    minutes = int(snapshot.age // 60)
+    if minutes < 120:
+        return f"\n\n(Last updated {minutes} minutes ago)"
+    return f"\n\n(Last updated {minutes // 60} hours ago)"
+
+
+scheduler = RefreshScheduler()
+
+
+@collector
+def refresh_metrics():
+    stats = scheduler.stats()
+    return [
+        ('ml_refresh_snapshot_age_seconds', 'gauge', 'Age of the last good result of each refresh job',
+         [({'job': name}, s['age_s']) for name, s in stats.items()]),
+        ('ml_refresh_consecutive_failures', 'gauge', 'Failed runs of each refresh job since its last success',
+         [({'job': name}, s['failures']) for name, s in stats.items()]),
+        ('ml_refresh_duration_seconds', 'gauge', 'Duration of the last run of each refresh job',
+         [({'job': name}, s['last_duration_ms'] / 1000 if s['last_duration_ms'] is not None else None)
+          for name, s in stats.items()]),
+    ]